@@ -34,6 +34,11 @@ setup(name="agx.generator.dexterity",
           'setuptools',
           ##code-section dependencies
           'agx.generator.plone',
+          'node.ext.directory<0.4',
+          'node.ext.python<0.2',
+          'node.ext.template<0.2',
+          'node.ext.xml<0.2',
+          'node.ext.zcml<0.2',
           ##/code-section dependencies
       ],
       extras_require = dict(
@@ -47,6 +52,9 @@ setup(name="agx.generator.dexterity",
       ##code-section entry_points
       [agx.generator]
       register = agx.generator.dexterity:register
+      [console_scripts]
+      agx-dexterity = agx.generator.dexterity.runner:main
+      agx-dexterity-benchmark = agx.generator.dexterity.benchmark:main
       ##/code-section entry_points
       """,
       ##code-section additionals
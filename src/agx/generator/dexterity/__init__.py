@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
-import scope
-import gsgenerator
-import dxgenerator
 
 
 def register():
     """Register this generator.
+
+    Scopes and handlers get registered lazily by ``lazy.dxload`` if the model
+    uses the dexterity profile.
     """
     import agx.generator.dexterity
+    import agx.generator.dexterity.lazy
     from agx.core.config import register_generator
     register_generator(agx.generator.dexterity)
@@ -0,0 +1,109 @@
+import os
+from zope.component import (
+    getUtility,
+    getUtilitiesFor,
+    getGlobalSiteManager,
+    provideUtility,
+)
+from node.ext.xml.interfaces import IXMLFactory
+from node.ext.xml._api import XMLNode
+from agx.core import Processor
+from agx.core.interfaces import (
+    IConfLoader,
+    IToken,
+    ITransform,
+)
+from agx.generator.dexterity.profilecache import ProfileTreeCache
+from agx.generator.dexterity.options import applied
+
+
+def reset():
+    """Reset process global state generators keep per model.
+
+    Tokens are registered as global utilities and some of them, i.e.
+    ``pyeggs`` or ``entry_points``, accumulate entries of all models
+    generated. The XML reference index is shared by all XML trees.
+    """
+    sm = getGlobalSiteManager()
+    for name, token in list(getUtilitiesFor(IToken)):
+        sm.unregisterUtility(token, IToken, name)
+    XMLNode.refindex.clear()
+
+
+def transform(sourcepath, targetpath):
+    """Run all transforms like ``agx.core.Controller`` but neither load
+    generator configurations again nor write the target tree.
+
+    @return: target root
+    """
+    source = target = None
+    for name in getUtility(IConfLoader).transforms:
+        transform = getUtility(ITransform, name=name)
+        source = transform.source(sourcepath)
+        if source is None:
+            source = target
+        target = transform.target(targetpath)
+        target = Processor(name)(source, target)
+    return target
+
+
+class Batch(object):
+    """Generate models one after another in one process.
+
+    Generator configurations are loaded once and parsed profiles are shared
+    by all models, generator state is reset before each model::
+
+        with Batch() as batch:
+            for modelpaths, outdir in jobs:
+                batch.generate(modelpaths, outdir)
+    """
+
+    def __init__(self):
+        self._factory = None
+
+    def open(self):
+        getUtility(IConfLoader)()
+        self._factory = getUtility(IXMLFactory)
+        provideUtility(ProfileTreeCache(self._factory), provides=IXMLFactory)
+        return self
+
+    def close(self):
+        if self._factory is None:
+            return
+        provideUtility(self._factory, provides=IXMLFactory)
+        self._factory = None
+        reset()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def transform(self, modelpaths, outdir, options=None):
+        """Run transforms on model without writing the target tree.
+
+        @param options: ``options.Options`` of the run, defaults to options
+            read from the environment
+        @return: target root
+        """
+        if self._factory is None:
+            raise RuntimeError(u"Batch not opened.")
+        reset()
+        with applied(options):
+            return transform(modelpaths, outdir)
+
+    def generate(self, modelpaths, outdir, options=None):
+        """Generate model and write to outdir.
+
+        Tokens are reset after writing too, thus they do not outlive the
+        run.
+        """
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+        try:
+            with applied(options):
+                self.transform(modelpaths, outdir, options)()
+        finally:
+            reset()
+        return outdir
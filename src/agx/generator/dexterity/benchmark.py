@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import multiprocessing
+from optparse import OptionParser
+from timeit import default_timer
+import pkg_resources
+from lxml import etree
+from agx.generator.dexterity.schema import field_types
+
+
+NAMESPACES = {
+    'xmi': 'http://schema.omg.org/spec/XMI/2.1',
+    'uml': 'http://www.eclipse.org/uml2/3.0.0/UML',
+    'dexterity': 'http:///schemas/dexterity/_fJKzwvoPS1iNRJeRe4kCkg/15',
+    'plone': 'http:///schemas/plone/_QyR3QFyDEeGwDp_qVn1OTQ/8',
+}
+
+XMI_ID = '{%s}id' % NAMESPACES['xmi']
+XMI_TYPE = '{%s}type' % NAMESPACES['xmi']
+
+STRING_TYPE = 'pathmap://UML_LIBRARIES/UMLPrimitiveTypes.library.uml#String'
+
+# the sample model provides namespaces, egg package and profile applications
+# of synthetic models
+TEMPLATE = pkg_resources.resource_filename(
+    'agx.generator.dexterity',
+    'testing/data/agx.generator.dexterity-sample.uml')
+
+
+# model shapes benchmarked by default
+SCENARIOS = {
+    'small': dict(types=5, fields=10, behaviors=2, compositions=4, views=2),
+    'medium': dict(types=25, fields=10, behaviors=10, compositions=24,
+                   views=10),
+    'large': dict(types=100, fields=20, behaviors=40, compositions=99,
+                  views=40),
+}
+
+# field stereotypes of all ``field_types`` groups, fields of synthetic
+# models cycle through them
+FIELD_STEREOTYPES = sorted(stereotype
+                           for group in field_types.values()
+                           for stereotype in group)
+
+# relative change of a measure tolerated against the baseline
+TOLERANCE = 0.25
+
+# absolute changes below are considered noise, seconds and kilobytes
+MIN_DELTA = {
+    'wall_time': 0.1,
+    'phases': 0.05,
+    'peak_memory': 10240,
+}
+
+
+def _element(parent, tag, **attrs):
+    ns, name = tag.split(':')
+    elem = etree.SubElement(parent, '{%s}%s' % (NAMESPACES[ns], name))
+    for key, value in attrs.items():
+        if key == 'id':
+            key = XMI_ID
+        elem.set(key, value)
+    return elem
+
+
+def _packaged(parent, type_, id, **attrs):
+    elem = etree.SubElement(parent, 'packagedElement')
+    elem.set(XMI_TYPE, type_)
+    elem.set(XMI_ID, id)
+    for key, value in attrs.items():
+        elem.set(key, value)
+    return elem
+
+
+def _class(package, root, id, name, fields):
+    class_ = _packaged(package, 'uml:Class', id, name=name)
+    for i in range(fields):
+        field_id = '%s_field_%i' % (id, i)
+        attribute = etree.SubElement(class_, 'ownedAttribute')
+        attribute.set(XMI_ID, field_id)
+        attribute.set('name', 'field_%i' % i)
+        type_ = etree.SubElement(attribute, 'type')
+        type_.set(XMI_TYPE, 'uml:PrimitiveType')
+        type_.set('href', STRING_TYPE)
+        stereotype = FIELD_STEREOTYPES[i % len(FIELD_STEREOTYPES)]
+        _element(root, stereotype, id='%s_stereotype' % field_id,
+                 base_Property=field_id, title="'Field %i'" % i,
+                 description="'Field %i of %s'" % (i, name))
+    return class_
+
+
+def _dependency(package, id, client, supplier):
+    _packaged(package, 'uml:Dependency', id, name='',
+              client=client, supplier=supplier)
+
+
+def _composition(package, id, container, child):
+    association = _packaged(package, 'uml:Association', id, name='',
+                            memberEnd='%s_container %s_child' % (id, id))
+    for end, type_ in (('container', container), ('child', child)):
+        owned = etree.SubElement(association, 'ownedEnd')
+        owned.set(XMI_ID, '%s_%s' % (id, end))
+        owned.set('name', '%s_%s' % (id, end))
+        owned.set('type', type_)
+        owned.set('association', id)
+        if end == 'child':
+            owned.set('aggregation', 'composite')
+        upper = etree.SubElement(owned, 'upperValue')
+        upper.set(XMI_TYPE, 'uml:LiteralUnlimitedNatural')
+        upper.set(XMI_ID, '%s_%s_upper' % (id, end))
+        upper.set('value', '*')
+        lower = etree.SubElement(owned, 'lowerValue')
+        lower.set(XMI_TYPE, 'uml:LiteralInteger')
+        lower.set(XMI_ID, '%s_%s_lower' % (id, end))
+
+
+def build_model(path, types=5, fields=10, behaviors=2, compositions=4,
+                views=2):
+    """Write synthetic UML model to path.
+
+    The model contains ``types`` content types with ``fields`` fields each,
+    field stereotypes cycle through all ``field_types`` groups. Behaviors
+    and dynamic views depend on content types, compositions chain content
+    types, all of them are assigned round robin.
+    """
+    tree = etree.parse(TEMPLATE)
+    root = tree.getroot()
+    model = root.find('{%s}Model' % NAMESPACES['uml'])
+    egg = model.find('packagedElement')
+    package = egg.find('packagedElement')
+    for child in list(package):
+        package.remove(child)
+    # keep package stereotypes only
+    for child in list(root):
+        if child is not model and child.get('base_Package') is None:
+            root.remove(child)
+    type_ids = list()
+    for i in range(types):
+        id = '_type_%i' % i
+        _class(package, root, id, 'Type%i' % i, fields)
+        _element(root, 'plone:content_type', id='%s_stereotype' % id,
+                 base_Class=id)
+        _element(root, 'dexterity:behavior_namefromtitle',
+                 id='%s_namefromtitle' % id, base_Class=id)
+        type_ids.append(id)
+    for i in range(behaviors):
+        id = '_behavior_%i' % i
+        _class(package, root, id, 'Behavior%i' % i, 2)
+        _element(root, 'dexterity:behavior', id='%s_stereotype' % id,
+                 base_Class=id)
+        _dependency(package, '%s_dependency' % id, id,
+                    type_ids[i % len(type_ids)])
+    for i in range(compositions):
+        container = type_ids[i % len(type_ids)]
+        child = type_ids[(i + 1) % len(type_ids)]
+        _composition(package, '_composition_%i' % i, container, child)
+    for i in range(views):
+        id = '_view_%i' % i
+        _packaged(package, 'uml:Class', id, name='View%i' % i)
+        _element(root, 'plone:dynamic_view', id='%s_stereotype' % id,
+                 base_Class=id, name='view_%i' % i)
+        _dependency(package, '%s_dependency' % id, id,
+                    type_ids[i % len(type_ids)])
+    tree.write(path, xml_declaration=True, encoding='UTF-8')
+    return path
+
+
+def measure(shape):
+    """Build model of shape and generate it, return measures.
+
+    Peak memory is the one of the calling process, thus meaningful only if
+    called in a fresh process as done by ``run``.
+    """
+    import agx.core
+    from agx.generator.dexterity.runner import configure
+    from agx.generator.dexterity.testing import profile_paths
+    from agx.generator.dexterity.instrumentation import (
+        observe_phases,
+        PhaseTimer,
+        peak_rss,
+    )
+    configure()
+    directory = tempfile.mkdtemp(prefix='agx-dexterity-benchmark-')
+    try:
+        modelpath = build_model(os.path.join(directory, 'model.uml'),
+                                **shape)
+        modelpaths = [modelpath] + profile_paths()
+        outdir = os.path.join(directory, 'out')
+        with observe_phases(PhaseTimer()) as timer:
+            start = default_timer()
+            agx.core.Controller()(modelpaths, outdir)
+            wall_time = default_timer() - start
+    finally:
+        shutil.rmtree(directory)
+    return {
+        'wall_time': wall_time,
+        'peak_memory': peak_rss(),
+        'phases': dict(timer.timings.items()),
+    }
+
+
+def run(shape, repeat=1):
+    """Measure shape ``repeat`` times, each in a fresh process.
+
+    Result of the fastest run is returned.
+    """
+    results = list()
+    for i in range(repeat):
+        pool = multiprocessing.Pool(1)
+        try:
+            results.append(pool.apply(measure, (shape,)))
+        finally:
+            pool.close()
+            pool.join()
+    return min(results, key=lambda result: result['wall_time'])
+
+
+def _regressed(measure, value, previous, tolerance):
+    return value - previous > max(previous * tolerance, MIN_DELTA[measure])
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Compare benchmark results against baseline.
+
+    Return list of regression messages, empty if none. Scenarios or phases
+    missing in baseline are not compared.
+    """
+    regressions = list()
+    for scenario, result in sorted(results.items()):
+        previous = baseline.get(scenario)
+        if previous is None:
+            continue
+        measures = [
+            ('wall_time', 'wall_time', result['wall_time'],
+             previous['wall_time']),
+            ('peak_memory', 'peak_memory', result['peak_memory'],
+             previous['peak_memory']),
+        ]
+        for name, value in sorted(result['phases'].items()):
+            if name in previous['phases']:
+                measures.append(('phases', name, value,
+                                 previous['phases'][name]))
+        for measure, name, value, prev in measures:
+            if _regressed(measure, value, prev, tolerance):
+                regressions.append('%s %s: %.3f -> %.3f' % (
+                    scenario, name, prev, value))
+    return regressions
+
+
+parser = OptionParser("Usage: agx-dexterity-benchmark [options]")
+parser.add_option("-s", "--scenario", dest="scenarios", action="append",
+                  default=None, help="Scenario to run, one of %s, may be "
+                  "given multiple times, defaults to all" % (
+                  ', '.join(sorted(SCENARIOS))))
+parser.add_option("--types", dest="types", type="int", default=None,
+                  help="Run custom scenario with number of content types")
+parser.add_option("--fields", dest="fields", type="int", default=10,
+                  help="Fields per content type of custom scenario")
+parser.add_option("--behaviors", dest="behaviors", type="int", default=2,
+                  help="Behaviors of custom scenario")
+parser.add_option("--compositions", dest="compositions", type="int",
+                  default=4, help="Compositions of custom scenario")
+parser.add_option("--views", dest="views", type="int", default=2,
+                  help="Dynamic views of custom scenario")
+parser.add_option("-r", "--repeat", dest="repeat", type="int", default=3,
+                  help="Runs per scenario, fastest one counts")
+parser.add_option("-o", "--output", dest="output", default=None,
+                  help="Write results as JSON to file instead of stdout")
+parser.add_option("-b", "--baseline", dest="baseline", default=None,
+                  help="Compare results against baseline JSON file, exit "
+                  "with status 1 on regressions")
+parser.add_option("--save-baseline", dest="save", action="store_true",
+                  default=False, help="Write results to baseline file")
+parser.add_option("-t", "--tolerance", dest="tolerance", type="float",
+                  default=TOLERANCE, help="Tolerated relative slowdown")
+
+
+def main(argv=None):
+    """Run benchmark scenarios and compare against baseline.
+    """
+    options, args = parser.parse_args(argv)
+    scenarios = dict()
+    if options.types is not None:
+        scenarios['custom'] = dict(
+            types=options.types, fields=options.fields,
+            behaviors=options.behaviors, compositions=options.compositions,
+            views=options.views)
+    for name in options.scenarios or (not scenarios and SCENARIOS) or []:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario '%s'" % name)
+        scenarios[name] = SCENARIOS[name]
+    results = dict()
+    for name, shape in sorted(scenarios.items()):
+        results[name] = run(shape, options.repeat)
+        results[name]['shape'] = shape
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as file:
+            file.write(output)
+    else:
+        print output
+    if not options.baseline:
+        return
+    if options.save or not os.path.exists(options.baseline):
+        with open(options.baseline, 'w') as file:
+            file.write(output)
+        return
+    with open(options.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, options.tolerance)
+    for regression in regressions:
+        sys.stderr.write('Regression: %s\n' % regression)
+    if regressions:
+        sys.exit(1)
@@ -0,0 +1,188 @@
+import os
+import logging
+from lxml import etree
+from odict import odict
+from node.ext.uml.interfaces import IProperty
+from node.ext.template import DTMLTemplate
+from agx.generator.dexterity.fti import OrderedSet
+from agx.generator.dexterity.schema import binary_field_types
+from agx.generator.dexterity.utils import (
+    memo,
+    field_classification,
+    tagged_values,
+)
+
+
+log = logging.getLogger('agx.generator.dexterity')
+
+
+# catalog index types which can be set by ``index`` tagged value of fields
+INDEX_TYPES = ('FieldIndex', 'KeywordIndex', 'DateIndex', 'BooleanIndex')
+
+# default index type by field stereotype, if ``index`` is set to true
+default_index_types = {
+    'dexterity:Date': 'DateIndex',
+    'dexterity:Datetime': 'DateIndex',
+    'dexterity:Bool': 'BooleanIndex',
+}
+
+# default index type by field group
+default_group_index_types = {
+    'collection': 'KeywordIndex',
+}
+
+
+def _true(value):
+    return value in ['True', 'true', 'TRUE', '1']
+
+
+class CatalogField(object):
+    """Catalog index and metadata column of a content type field.
+    """
+    __slots__ = ('name', 'index', 'metadata')
+
+    def __init__(self, name, index=None, metadata=False):
+        self.name = name
+        self.index = index
+        self.metadata = metadata
+
+
+def index_type(value, field_def, group):
+    """Index type from ``index`` tagged value.
+
+    True values select the default index type of the field.
+    """
+    if value in INDEX_TYPES:
+        return value
+    if _true(value):
+        default = default_index_types.get(field_def['stereotype'])
+        return default or default_group_index_types.get(group, 'FieldIndex')
+    if not value or value in ['False', 'false', 'FALSE', '0']:
+        return None
+    raise RuntimeError(u"Unknown index type '%s', expected one of %s" % (
+                       value, ', '.join(INDEX_TYPES)))
+
+
+def catalog_fields(content_type):
+    """Return list of ``CatalogField`` for fields of content type which are
+    indexed or stored as metadata.
+
+    Read once per content type.
+    """
+    values = memo(content_type)
+    fields = values.get('catalog')
+    if fields is not None:
+        return fields
+    fields = values['catalog'] = list()
+    for prop in content_type.filtereditervalues(IProperty):
+        for group, field_def in field_classification(prop).items():
+            tgv = tagged_values(prop, field_def['stereotype'])
+            index = index_type(tgv.get('index'), field_def, group)
+            metadata = _true(tgv.get('metadata', 'False'))
+            if metadata and field_def['stereotype'] in binary_field_types:
+                # brains would load file data of each listed object
+                log.warning(u"Binary field '%s' of '%s' not added as "
+                            u"catalog metadata" % (prop.name,
+                                                   content_type.name))
+                metadata = False
+            if index or metadata:
+                fields.append(CatalogField(prop.name, index, metadata))
+            break
+    return fields
+
+
+def catalog(default):
+    """Return catalog record of GenericSetup profile directory.
+
+    Dict containing odict of index types by name as ``indexes`` and
+    ``OrderedSet`` of metadata columns as ``columns``. Collected once per run
+    and written by ``render``.
+    """
+    try:
+        return default.__dict__['_agx_dexterity_catalog']
+    except KeyError:
+        record = {
+            'indexes': odict(),
+            'columns': OrderedSet(),
+        }
+        return default.__dict__.setdefault('_agx_dexterity_catalog', record)
+
+
+def add_fields(default, fields):
+    """Add catalog fields to catalog record of profile directory.
+
+    Indexes of the same name are added once, the first index type wins.
+    """
+    record = catalog(default)
+    for field in fields:
+        if field.index and field.name not in record['indexes']:
+            record['indexes'][field.name] = field.index
+        if field.metadata:
+            record['columns'].add(field.name)
+
+
+def existing_catalog(default):
+    """Read indexes and metadata columns of ``catalog.xml`` on the file
+    system.
+
+    @return: tuple of list of ``(name, meta_type)`` and list of column names
+    """
+    path = os.path.join(*default.fs_path + ['catalog.xml'])
+    if not os.path.exists(path):
+        return list(), list()
+    root = etree.parse(path).getroot()
+    indexes = [(node.get('name'), node.get('meta_type'))
+               for node in root.findall('index')]
+    columns = [node.get('value') for node in root.findall('column')]
+    return indexes, columns
+
+
+def merge_catalog(default, record):
+    """Merge ``catalog.xml`` on the file system with record.
+
+    Order of existing indexes and columns is kept, new ones are appended.
+    """
+    indexes, columns = existing_catalog(default)
+    merged = {
+        'indexes': odict(),
+        'columns': OrderedSet(),
+    }
+    for name, meta_type in indexes:
+        merged['indexes'][name] = record['indexes'].get(name, meta_type)
+    for name, meta_type in record['indexes'].items():
+        if name not in merged['indexes']:
+            merged['indexes'][name] = meta_type
+    for name in columns + list(record['columns']):
+        merged['columns'].add(name)
+    return merged
+
+
+def render(default, merge=False):
+    """Write collected indexes and metadata columns to ``catalog.xml``.
+
+    @param merge: flag whether indexes and columns of ``catalog.xml`` not
+        generated are kept, set if the model got restricted
+    """
+    record = catalog(default)
+    if merge:
+        record = merge_catalog(default, record)
+    if not record['indexes'] and not record['columns']:
+        return
+    if 'catalog.xml' in default:
+        catalog_xml = default['catalog.xml']
+    else:
+        catalog_xml = default['catalog.xml'] = DTMLTemplate()
+    catalog_xml.template = 'agx.generator.plone:templates/catalog.xml'
+    catalog_xml.params['defs'] = {
+        'portal_catalog': {
+            'metatype': 'Plone Catalog Tool',
+            'indexes': [{
+                'name': name,
+                'meta_type': meta_type,
+                'indexed_attributes': [name],
+                'extras': [],
+                'properties': [],
+            } for name, meta_type in record['indexes'].items()],
+            'columns': [{'value': name} for name in record['columns']],
+        },
+    }
@@ -0,0 +1,230 @@
+import os
+import difflib
+from fnmatch import fnmatch
+from lxml import etree
+from zope.component import getUtility
+from node.ext.directory.interfaces import (
+    IDirectory,
+    IFile,
+)
+from node.ext.python.interfaces import IModule
+from node.ext.template.template import TemplateBase
+from node.ext.zcml.interfaces import IZCMLFile
+from node.ext.zcml._api import ZCMLFormatter
+from agx.core.interfaces import IConfLoader
+from agx.generator.dexterity.batch import transform
+from agx.generator.dexterity.options import applied
+
+
+# files compared by default, matched against path relative to the output
+# directory
+PATTERNS = ('*.py', '*.zcml', '*types.xml', '*/types/*.xml')
+
+# states of files
+NEW = 'new'
+CHANGED = 'changed'
+REMOVED = 'removed'
+UNCHANGED = 'unchanged'
+STATES = (NEW, CHANGED, REMOVED, UNCHANGED)
+
+
+def matches(path, patterns):
+    for pattern in patterns:
+        if fnmatch(path, pattern):
+            return True
+    return False
+
+
+def files(directory, patterns=PATTERNS):
+    """Paths of files in directory matching patterns, relative to directory.
+    """
+    ret = list()
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for name in filenames:
+            path = os.path.relpath(os.path.join(dirpath, name), directory)
+            path = path.replace(os.sep, '/')
+            if matches(path, patterns):
+                ret.append(path)
+    return sorted(ret)
+
+
+def _read(directory, path):
+    with open(os.path.join(directory, *path.split('/')), 'rb') as file:
+        return file.read()
+
+
+def _encode(data):
+    if isinstance(data, unicode):
+        return data.encode('utf-8')
+    return data
+
+
+def render(node):
+    """Contents file node would be written with when calling the target
+    tree, without writing it.
+
+    Modules are rendered by their renderer with file writing disabled, as
+    the renderer tests of ``node.ext.python`` do. Templates are rendered with
+    ``write`` collecting the buffer instead of writing it.
+
+    @return: file contents, None if node would not be written
+    """
+    if IModule.providedBy(node):
+        renderer = node.rendererfactory(node)
+        renderer._write_file = False
+        return _encode(renderer())
+    if IZCMLFile.providedBy(node):
+        formatted = ZCMLFormatter().format(
+            etree.tostring(node.model.root.element, pretty_print=True))
+        return "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n" + formatted
+    if isinstance(node, TemplateBase):
+        written = list()
+        node.write = lambda buffer: written.append(u''.join(buffer))
+        try:
+            node()
+        finally:
+            del node.write
+        if not written:
+            return None
+        return _encode(written[0])
+    if IFile.providedBy(node):
+        return _encode(node.data)
+    return None
+
+
+class FileDiff(object):
+    """State of a file compared to the file system.
+    """
+    __slots__ = ('path', 'state', 'existing', 'rendered')
+
+    def __init__(self, path, state, existing=None, rendered=None):
+        self.path = path
+        self.state = state
+        self.existing = existing
+        self.rendered = rendered
+
+    def unified(self):
+        """Unified diff lines of changed file.
+        """
+        existing = (self.existing or '').splitlines(True)
+        rendered = (self.rendered or '').splitlines(True)
+        return list(difflib.unified_diff(existing, rendered,
+                                         'a/%s' % self.path,
+                                         'b/%s' % self.path))
+
+
+def compare(generated, existing, patterns=PATTERNS):
+    """Compare files of a generated directory with an existing one.
+
+    @param generated: directory generated into
+    @param existing: directory compared with, might not exist
+    @param patterns: shell patterns of paths relative to the directories
+    @return: list of ``FileDiff`` sorted by path. ``new`` files exist in the
+        generated directory only, ``removed`` files in the existing one only
+    """
+    diffs = list()
+    before = set()
+    if os.path.isdir(existing):
+        before = set(files(existing, patterns))
+    after = files(generated, patterns)
+    for path in after:
+        rendered = _read(generated, path)
+        if path not in before:
+            diffs.append(FileDiff(path, NEW, None, rendered))
+            continue
+        data = _read(existing, path)
+        if data == rendered:
+            diffs.append(FileDiff(path, UNCHANGED))
+        else:
+            diffs.append(FileDiff(path, CHANGED, data, rendered))
+    for path in before.difference(after):
+        diffs.append(FileDiff(path, REMOVED, _read(existing, path)))
+    return sorted(diffs, key=lambda diff: diff.path)
+
+
+def compare_tree(target, patterns=PATTERNS):
+    """Compare a target tree not written yet with the file system.
+
+    @param target: target root returned by ``batch.transform``
+    @param patterns: shell patterns of paths relative to the target root
+    @return: list of ``FileDiff`` sorted by path
+    """
+    diffs = list()
+    root = os.path.join(*target.fs_path)
+
+    def walk(directory, prefix):
+        # removed by generators, deleted when the tree is written
+        for name in directory._deleted:
+            path = prefix + name
+            abspath = os.path.join(root, path)
+            if os.path.isdir(abspath):
+                for subpath in files(abspath, ('*',)):
+                    if matches(path + '/' + subpath, patterns):
+                        diffs.append(FileDiff(path + '/' + subpath, REMOVED,
+                                              _read(abspath, subpath)))
+            elif os.path.isfile(abspath) and matches(path, patterns):
+                diffs.append(FileDiff(path, REMOVED, _read(root, path)))
+        for name in sorted(directory.keys()):
+            path = prefix + name
+            abspath = os.path.join(root, path)
+            # files not touched by generators are loaded if compared only,
+            # they are written again as loaded
+            if name not in directory.storage \
+              and not os.path.isdir(abspath) and not matches(path, patterns):
+                continue
+            node = directory[name]
+            if IDirectory.providedBy(node):
+                walk(node, path + '/')
+                continue
+            if not matches(path, patterns):
+                continue
+            rendered = render(node)
+            if not os.path.exists(abspath):
+                diffs.append(FileDiff(path, NEW, None, rendered or ''))
+                continue
+            if rendered is None:
+                diffs.append(FileDiff(path, UNCHANGED))
+                continue
+            existing = _read(root, path)
+            if existing == rendered:
+                diffs.append(FileDiff(path, UNCHANGED))
+            else:
+                diffs.append(FileDiff(path, CHANGED, existing, rendered))
+    walk(target, '')
+    return sorted(diffs, key=lambda diff: diff.path)
+
+
+def dryrun(modelpaths, outdir, patterns=PATTERNS, options=None, batch=None):
+    """Generate model in memory and compare it with outdir. Nothing is
+    written.
+
+    @param options: ``options.Options`` of the run
+    @param batch: opened ``batch.Batch`` generating the model, otherwise
+        generator configurations are loaded like ``agx.core.Controller``
+        does
+    @return: list of ``FileDiff`` sorted by path
+    """
+    if batch is not None:
+        target = batch.transform(modelpaths, outdir, options)
+    else:
+        getUtility(IConfLoader)()
+        with applied(options):
+            target = transform(modelpaths, outdir)
+    return compare_tree(target, patterns)
+
+
+def report(diffs, unified=False, unchanged=False):
+    """Text report of file diffs grouped by state.
+    """
+    lines = list()
+    for state in STATES:
+        if state == UNCHANGED and not unchanged:
+            continue
+        for diff in diffs:
+            if diff.state == state:
+                lines.append('%-10s %s' % (state, diff.path))
+    if unified:
+        for diff in diffs:
+            if diff.state == CHANGED:
+                lines.extend([line.rstrip('\n') for line in diff.unified()])
+    return '\n'.join(lines)
@@ -1,14 +1,13 @@
 import os
 import uuid
+import logging
+import pkg_resources
 from zope.interface import alsoProvides
 from node.ext import python
 from node.ext.python.interfaces import IModule
 from node.ext.python.utils import Imports
-from node.ext.uml.utils import (
-    TaggedValues,
-    UNSET,
-)
-from node.ext.uml.interfaces import IClass
+from node.ext.uml.interfaces import IProperty
+from node.ext.uml.utils import TaggedValues
 from node.ext.directory import (
     MODE_BINARY,
     File,
@@ -27,38 +26,53 @@ from agx.core.util import (
     read_target_node,
     dotted_path,
 )
-from agx.generator.pyegg.treesync import ModuleNameChooser
 from agx.generator.pyegg.utils import (
     set_copyright,
     sort_classes_in_module,
     class_base_name,
     class_full_name,
-    egg_source,
 )
 from agx.generator.zca.utils import (
     zcml_include_package,
     set_zcml_namespace,
-    set_zcml_directive,
-    get_zcml,
 )
 from agx.generator.dexterity.schema import (
     field_properties,
     field_defaults,
-    field_types,
+    field_group_properties,
+    blob_field_types,
+    binary_field_types,
+)
+from agx.generator.dexterity.interfaces import (
+    IDexterityType,
+    IDexterityBehavior,
+)
+from agx.generator.dexterity.treesync import (
+    DexterityModuleNameChooser,
+    DexterityBehaviorModuleNameChooser,
+)
+from agx.generator.dexterity.fti import lookup_fti
+from agx.generator.dexterity import selection
+from agx.generator.dexterity import incremental
+from agx.generator.dexterity import registration
+from agx.generator.dexterity.options import current
+from agx.generator.dexterity.catalog import catalog_fields
+from agx.generator.dexterity.utils import (
+    memo,
+    target_node,
+    egg_source,
+    schema_class,
+    type_id,
+    field_index,
+    field_classification,
+    tagged_values,
+    ensure_directives,
+    remove_directives,
+    remove_imports,
 )
-from agx.generator.dexterity.utils import type_id
-
-
-class DexterityModuleNameChooser(ModuleNameChooser):
-
-    def __call__(self):
-        return self.context.name.lower()
-
 
-class DexterityBehaviorModuleNameChooser(ModuleNameChooser):
 
-    def __call__(self):
-        return self.context.name[1:].lower()
+log = logging.getLogger('agx.generator.dexterity')
 
 
 ###############################################################################
@@ -66,154 +80,193 @@ class DexterityBehaviorModuleNameChooser(ModuleNameChooser):
 ###############################################################################
 
 
-def tgv_value(attr, value):
-    format = field_properties[attr]
-    if format == 'i18n_string':
-        value = value.strip('"').strip("'")
-        return '_(u"%s")' % value
-    elif format == 'string':
-        value = value.strip('"').strip("'")
-        return "u'%s'" % value
-    elif format == 'bool':
-        if value in ['True', 'true', 'TRUE', '1']:
-            return True
-        if value in ['False', 'false', 'FALSE', '0']:
-            return False
-        return bool(value)
-    elif format == 'int':
-        return int(value)
-    elif format == 'raw':
-        return value
-    raise RuntimeError(u"Unknown format for '%s': '%s'" % (attr, format))
+def _i18n_string(value):
+    value = value.strip('"').strip("'")
+    return '_(u"%s")' % value
 
 
-_marker = object()
+def _string(value):
+    value = value.strip('"').strip("'")
+    return "u'%s'" % value
 
 
-def read_tgv(tgv, attribute, stereotype, attrs):
-    for attr in attrs:
-        value = tgv.direct(attr, stereotype)
-        if value is not UNSET:
-            attribute.kwargs[attr] = tgv_value(attr, value)
-        else:
-            default = field_defaults.get(attr, _marker)
-            if default is not _marker:
-                attribute.kwargs[attr] = default
+def _bool(value):
+    if value in ['True', 'true', 'TRUE', '1']:
+        return True
+    if value in ['False', 'false', 'FALSE', '0']:
+        return False
+    return bool(value)
 
 
-def field_tgv(tgv, attribute, stereotype):
-    attrs = ['title', 'description', 'required', 'readonly', 'default',
-             'missing_value']
-    read_tgv(tgv, attribute, stereotype, attrs)
+def _raw(value):
+    return value
 
 
-def minmaxlen_tgv(tgv, attribute, stereotype):
-    field_tgv(tgv, attribute, stereotype)
-    attrs = ['min_length', 'max_length']
-    read_tgv(tgv, attribute, stereotype, attrs)
+tgv_formats = {
+    'i18n_string': _i18n_string,
+    'string': _string,
+    'bool': _bool,
+    'int': int,
+    'raw': _raw,
+}
 
 
-def collection_tgv(tgv, attribute, stereotype):
-    minmaxlen_tgv(tgv, attribute, stereotype)
-    attrs = ['value_type', 'unique']
-    read_tgv(tgv, attribute, stereotype, attrs)
+def compile_field_converters(field_properties):
+    """Map schema field properties to converter callables.
+    """
+    converters = dict()
+    for attr, format in field_properties.items():
+        if not format in tgv_formats:
+            raise RuntimeError(u"Unknown format for '%s': '%s'" % (attr,
+                                                                   format))
+        converters[attr] = tgv_formats[format]
+    return converters
 
 
-def dict_tgv(tgv, attribute, stereotype):
-    minmaxlen_tgv(tgv, attribute, stereotype)
-    attrs = ['key_type', 'value_type']
-    read_tgv(tgv, attribute, stereotype, attrs)
+field_converters = compile_field_converters(field_properties)
 
 
-def richtext_tgv(tgv, attribute, stereotype):
-    field_tgv(tgv, attribute, stereotype)
-    attrs = ['default_mime_type', 'output_mime_type', 'allowed_mime_types']
-    read_tgv(tgv, attribute, stereotype, attrs)
+def tgv_value(attr, value):
+    return field_converters[attr](value)
 
 
-def minmax_tgv(tgv, attribute, stereotype):
-    field_tgv(tgv, attribute, stereotype)
-    attrs = ['min', 'max']
-    read_tgv(tgv, attribute, stereotype, attrs)
+_marker = object()
 
 
-def object_tgv(tgv, attribute, stereotype):
-    field_tgv(tgv, attribute, stereotype)
-    attrs = ['schema']
-    read_tgv(tgv, attribute, stereotype, attrs)
+def read_tgv(values, attribute, attrs):
+    for attr in attrs:
+        value = values.get(attr, _marker)
+        if value is not _marker:
+            attribute.kwargs[attr] = field_converters[attr](value)
+        else:
+            default = field_defaults.get(attr, _marker)
+            if default is not _marker:
+                attribute.kwargs[attr] = default
 
 
 def field_def_for(group, stereotype):
-    field = field_types[group].get(stereotype)
-    if not field:
+    entry = field_index.get(stereotype)
+    if entry is None or entry[0] != group:
         return None
-    return {
-        'factory': field['factory'],
-        'import': field.get('import', 'schema'),
-        'import_from': field.get('import_from', 'zope'),
-        'depends':  field.get('depends'),
-        'stereotype': stereotype,
-    }
+    return entry[1]
 
 
 def lookup_field_def(source, group):
-    field = None
-    for st in source.stereotypes:
-        field = field_def_for(group, st.name)
-        if field:
-            break
+    field = field_classification(source).get(group)
     if not field:
         raise RuntimeError(u"Field definition not found for %s" % source.name)
     return field
 
 
-def transform_attribute(source, target, group, fetch_tgv):
+def blobs_enabled():
+    """Binary fields are stored in blobs unless disabled by ``blobs`` option
+    of the run.
+
+    Disable for packages with content created by non blob fields, blob
+    fields can not read them.
+    """
+    return current().blobs
+
+
+def storage_field_def(field_def, values):
+    """Return field definition of blob counterpart for binary fields not
+    stored in blobs.
+
+    The ``blob`` tagged value overrides ``blobs_enabled``.
+    """
+    blob = blob_field_types.get(field_def['stereotype'])
+    if blob is None:
+        return field_def
+    if 'blob' in values:
+        enabled = _bool(values['blob'])
+    else:
+        enabled = blobs_enabled()
+    if not enabled:
+        return field_def
+    return field_index[blob][1]
+
+
+def storage_counterparts():
+    """Return dict mapping factories of binary fields to the factory of
+    their counterpart with the other storage, in both directions.
+    """
+    ret = dict()
+    for name, blob in blob_field_types.items():
+        plain = field_index[name][1]['factory']
+        blob = field_index[blob][1]['factory']
+        ret[plain] = blob
+        ret[blob] = plain
+    return ret
+
+
+def binary_imports():
+    """Return list of ``(fromimport, name)`` imports of binary fields.
+    """
+    ret = list()
+    for name in sorted(binary_field_types):
+        field_def = field_index[name][1]
+        ret.append((field_def['import_from'], field_def['import']))
+    return ret
+
+
+def remove_binary_imports(module):
+    """Remove imports of binary fields not used by module any more, i.e.
+    after switching storage.
+    """
+    remove_imports(module, binary_imports())
+
+
+def transform_attribute(source, target, group):
     field_def = lookup_field_def(source, group)
-    attribute = read_target_node(source, target.target)
+    attribute = target_node(source, target.target)
     if not attribute: # attribute has been removed
         return
+    values = tagged_values(source, field_def['stereotype'])
+    field_def = storage_field_def(field_def, values)
     attribute.value = field_def['factory']
-    tgv = TaggedValues(source)
-    fetch_tgv(tgv, attribute, field_def['stereotype'])
-    imp = Imports(attribute.parent.parent)
+    read_tgv(values, attribute, field_group_properties[group])
+    module = attribute.parent.parent
+    imp = Imports(module)
     imp.set(field_def['import_from'], [[field_def['import'], None]])
+    if field_def['stereotype'] in binary_field_types:
+        remove_binary_imports(module)
     if field_def['depends']:
         pass # XXX write to setup.py setup_dependencies
 
 
 @handler('dxcollection', 'uml2fs', 'zcagenerator', 'dxcollection', order=100)
 def dxcollection(self, source, target):
-    transform_attribute(source, target, 'collection', collection_tgv)
+    transform_attribute(source, target, 'collection')
 
 
 @handler('dxminmaxlen', 'uml2fs', 'zcagenerator', 'dxminmaxlen', order=100)
 def dxminmaxlen(self, source, target):
-    transform_attribute(source, target, 'minmaxlen', minmaxlen_tgv)
+    transform_attribute(source, target, 'minmaxlen')
 
 
 @handler('dxdict', 'uml2fs', 'zcagenerator', 'dxdict', order=100)
 def dxdict(self, source, target):
-    transform_attribute(source, target, 'dict', dict_tgv)
+    transform_attribute(source, target, 'dict')
 
 
 @handler('dxfield', 'uml2fs', 'zcagenerator', 'dxfield', order=100)
 def dxfield(self, source, target):
-    transform_attribute(source, target, 'field', field_tgv)
+    transform_attribute(source, target, 'field')
 
 
 @handler('dxrichtext', 'uml2fs', 'zcagenerator', 'dxrichtext', order=100)
 def dxrichtext(self, source, target):
-    transform_attribute(source, target, 'richtext', richtext_tgv)
+    transform_attribute(source, target, 'richtext')
 
 
 @handler('dxminmax', 'uml2fs', 'zcagenerator', 'dxminmax', order=100)
 def dxminmax(self, source, target):
-    transform_attribute(source, target, 'minmax', minmax_tgv)
+    transform_attribute(source, target, 'minmax')
 
 
 @handler('dxobject', 'uml2fs', 'zcagenerator', 'dxobject', order=100)
 def dxobject(self, source, target):
-    transform_attribute(source, target, 'object', object_tgv)
+    transform_attribute(source, target, 'object')
 
 
 ###############################################################################
@@ -222,11 +275,33 @@ def dxobject(self, source, target):
 
 
 def getschemaclass(source, target):
-    klass = read_target_node(source, target.target)
-    module = klass.parent
-    schemaclassname = 'I' + klass.classname
-    found = module.classes(schemaclassname)
-    return found[0]
+    return schema_class(source, target.target)
+
+
+@handler('dxselection', 'xmi2uml', 'dxselectiongenerator', 'dxmodel')
+def dxselection(self, source, target):
+    """Restrict the model to selected content types and behaviors, and in
+    incremental mode to the ones changed since the last run.
+
+    Runs once after the UML model is read, before it gets transformed.
+    """
+    model = target.target
+    if incremental.enabled():
+        # fingerprints cover the whole model
+        incremental.fingerprints(model)
+    selected = selection.selected()
+    if selected:
+        selection.prune(model, selection.closure(model, selected))
+    if incremental.enabled():
+        # the UML model is named by the output directory
+        incremental.restrict(model, model.__name__)
+
+
+@handler('dxfingerprints', 'uml2fs', 'dxpurgegenerator', 'pythonegg')
+def dxfingerprints(self, source, target):
+    """Store fingerprints of generated types in incremental mode.
+    """
+    incremental.store(source.root, target.target)
 
 
 @handler('createschemaclass', 'uml2fs', 'hierarchygenerator',
@@ -234,13 +309,11 @@ def getschemaclass(source, target):
 def createschemaclass(self, source, target):
     """create the schema interface class on the fly.
     """
-    klass = read_target_node(source, target.target)
+    klass = target_node(source, target.target)
     module = klass.parent
     schemaclassname = 'I' + klass.classname
-    found = module.classes(schemaclassname)
-    if found:
-        schemaclass = found[0]
-    else:
+    schemaclass = getschemaclass(source, target)
+    if schemaclass is None:
         schemaclass = python.Class(classname=schemaclassname)
         schemaclass.__name__ = schemaclass.uuid
         module.insertbefore(schemaclass, klass)
@@ -253,6 +326,17 @@ def createschemaclass(self, source, target):
                                            False)
     if not (createit or klass.functions()):
         token(str(klass.uuid), True, dont_generate=True)
+        suppressed = memo(egg_source(source)).setdefault('suppressed', list())
+        suppressed.append(source)
+
+
+def is_schema_property(prop):
+    """Check whether UML property has a stereotype of dexterity profile.
+    """
+    for stereotype in prop.stereotypes:
+        if stereotype.name.startswith('dexterity:'):
+            return True
+    return False
 
 
 @handler('schemaclass_move_attribs', 'uml2fs', 'dxcleanupgenerator',
@@ -260,55 +344,97 @@ def createschemaclass(self, source, target):
 def schemaclass_move_attribs(self, source, target):
     """Move the content class attribute to the schema class.
     """
-    klass = read_target_node(source, target.target)
-    module = klass.parent
-    schemaclassname = 'I' + klass.classname
-    found = module.classes(schemaclassname)
-    if found:
-        schemaclass = found[0]
-    else:
+    klass = target_node(source, target.target)
+    schemaclass = getschemaclass(source, target)
+    if schemaclass is None:
         return
+    # move only schema attributes
+    # we will decide this heuristically by checking if the properties
+    # stereotype is 'dexterity'
+    # XXX: check if this is sufficient
+    properties = dict()
+    for prop in source.filtereditervalues(IProperty):
+        properties[prop.name] = prop
+    existing = dict()
+    for att in schemaclass.attributes():
+        for name in att.targets:
+            existing[name] = att
+    counterparts = storage_counterparts()
+    binary = False
+    unmapped = list()
     # transfer the attributes into the schema class
     for att in klass.attributes():
-        # move only schema attributes
-        # we will decide this heuristically by checking if the properties stereotype is 'dexterity'
-        # XXX: check if this is sufficient
-        isschema=False
-        try:
-            prop=source[att.targets[0]]
-            isschema = 'dexterity'  in [ ss.profile.name for ss in prop.stereotypes]
-        except:
-            print 'error checking for stereotype dexterity in att %s' % att.value
-            
+        if not att.targets:
+            continue
+        name = att.targets[0]
+        prop = properties.get(name)
+        if prop is None:
+            unmapped.append(name)
+            isschema = False
+        else:
+            isschema = is_schema_property(prop)
         if isschema or att.value == 'None' or att.value.startswith('schema.'):
             klass.detach(att.__name__)
-            if not schemaclass.attributes(att.targets[0]):
+            factory = att.value.split('(')[0]
+            if factory in counterparts:
+                binary = True
+            if name not in existing:
                 schemaclass.insertlast(att)
+                for name in att.targets:
+                    existing[name] = att
+                continue
+            # storage of binary field switched. existing attributes keep
+            # their arguments, values of parsed ones contain the whole call
+            existing_att = existing[name]
+            current = existing_att.value.split('(')[0]
+            if current != counterparts.get(factory):
+                continue
+            if existing_att.args or existing_att.kwargs:
+                existing_att.value = factory
             else:
-                del att
+                existing_att.value = factory + existing_att.value[len(current):]
+    if binary:
+        remove_binary_imports(schemaclass.parent)
+    if unmapped:
+        log.debug("Attributes of class '%s' not defined in model: %s" % (
+                  klass.classname, ', '.join(unmapped)))
 
 
-@handler('purgecontentclasses', 'uml2fs', 'dxcleanupgenerator',
-         'contenttype', order=160)
+@handler('purgecontentclasses', 'uml2fs', 'dxpurgegenerator', 'pythonegg')
 def purgecontentclasses(self, source, target):
     """remove the content classes that should not be generated.
+
+    Runs once per egg after all content types are processed. Suppressed
+    classes are collected by ``createschemaclass``, imports of each affected
+    ``__init__.py`` are rewritten once.
     """
-    klass = read_target_node(source, target.target)
-    module = klass.parent
-    if token(str(klass.uuid), False, dont_generate=False).dont_generate:
+    suppressed = memo(source).get('suppressed')
+    if not suppressed:
+        return
+    inits = dict()
+    for content_type in suppressed:
+        klass = target_node(content_type, target.target)
+        if klass is None \
+          or not token(str(klass.uuid), False,
+                       dont_generate=False).dont_generate:
+            continue
+        module = klass.parent
         module.detach(klass.__name__)
-        # remove the imports
         init = module.parent['__init__.py']
-        imps = init.imports()
-        impname = [klass.classname, None]
-        for imp in imps:
-            if impname in imp.names:
-                if len(imp.names) > 1:
-                    # if more names are in the imp delete the name
-                    imp.names=[n for n in imp.names if n != impname]
-                else:
-                    # delete the whole import
-                    init.detach(imp.__name__)
+        inits.setdefault(init.uuid, (init, set()))[1].add(klass.classname)
+    # remove the imports
+    for init, classnames in inits.values():
+        for imp in init.imports():
+            names = [n for n in imp.names
+                     if n[1] is not None or n[0] not in classnames]
+            if len(names) == len(imp.names):
+                continue
+            if names:
+                # if more names are in the imp delete the name
+                imp.names = names
+            else:
+                # delete the whole import
+                init.detach(imp.__name__)
 
 
 @handler('grokforcontentclass', 'uml2fs', 'connectorgenerator',
@@ -316,7 +442,7 @@ def purgecontentclasses(self, source, target):
 def grokforcontentclass(self, source, target):
     """create the schema interface class on the fly.
     """
-    klass = read_target_node(source, target.target)
+    klass = target_node(source, target.target)
     module = klass.parent
     schemaclassname = 'I' + klass.classname
     # add the schemaclass to realizes, the rest is done by the
@@ -325,21 +451,34 @@ def grokforcontentclass(self, source, target):
     impltok.realizes.insert(0, {'name': schemaclassname})
 
     require = "grok.name('%s')" % dotted_path(source)
-    require_exists = False
+    classpath = '.%s.%s' % (module.modulename, klass.classname)
+    if not registration.enabled():
+        ensure_directives(klass, [require])
+        registration.remove_directives(module.parent, 'configure.zcml',
+                                       'class', 'class', classpath)
+        return
+    remove_directives(klass, [require])
+    # content classes not generated are removed by ``purgecontentclasses``
+    if token(str(klass.uuid), False, dont_generate=False).dont_generate:
+        return
+    registration.set_class(
+        module.parent,
+        classpath,
+        '.%s.%s' % (module.modulename, schemaclassname),
+        'zope2.View')
 
-    for block in klass.blocks():
-        for line in block.lines:
-            if line == require:
-                require_exists = True
 
-    block = python.Block()
-    block.__name__ = str(uuid.uuid4())
+# base classes of content classes in both registration modes
+CONTENT_BASES = ('dexterity.Item', 'dexterity.Container', 'Item', 'Container')
 
-    if not require_exists:
-        block.lines.append(require)
 
-    if block.lines:
-        klass.insertfirst(block)
+def content_base(name):
+    """Name of base class ``name`` of ``plone.dexterity.content`` in content
+    modules.
+    """
+    if registration.enabled():
+        return name
+    return 'dexterity.%s' % name
 
 
 @handler('dxcomposition', 'uml2fs', 'zcasemanticsgenerator',
@@ -348,42 +487,62 @@ def dxcomposition(self, source, target):
     # get container. ownedEnds len should always be 2
     container = source.ownedEnds[0].type
     if container.stereotype('plone:content_type'):
-        klass = read_target_node(container, target.target)
+        klass = target_node(container, target.target)
         token(str(klass.uuid), True, folderish=True)
-        bases = [b for b in klass.bases if b != 'dexterity.Item']
-        if 'dexterity.Container' not in bases:
-            klass.bases = ['dexterity.Container'] + bases
+        bases = [b for b in klass.bases if b not in CONTENT_BASES]
+        klass.bases = [content_base('Container')] + bases
 
 
 @handler('dxitem', 'uml2fs', 'zcasemanticsgenerator', 'contenttype', order=99)
 def dxitem(self, source, target):
-    schema = getschemaclass(source,target)
-    klass = read_target_node(source, target.target)
+    schema = getschemaclass(source, target)
+    klass = target_node(source, target.target)
     module = schema.parent
-    bases = [b for b in klass.bases if b != 'dexterity.Container']
-    if 'dexterity.Item' not in bases:
-        klass.bases = ['dexterity.Item'] + bases
+    bases = [b for b in klass.bases if b not in CONTENT_BASES]
+    klass.bases = [content_base('Item')] + bases
+
+
+@handler('contentclassbase', 'uml2fs', 'dxcleanupgenerator', 'contenttype',
+         order=100)
+def contentclassbase(self, source, target):
+    """Import base class of content class in ZCML mode.
+
+    Otherwise ``dexterity`` is imported from ``plone.directives`` by
+    ``typeview``.
+    """
+    if not registration.enabled():
+        return
+    klass = target_node(source, target.target)
+    if token(str(klass.uuid), False, dont_generate=False).dont_generate:
+        return
+    for name in ['Item', 'Container']:
+        if name in klass.bases:
+            Imports(klass.parent).set('plone.dexterity.content',
+                                      [[name, None]])
+
+
+@handler('contentimports', 'uml2fs', 'dxcleanupgenerator', 'contenttype',
+         order=110)
+def contentimports(self, source, target):
+    """Remove imports of the other registration mode from content module.
+    """
+    schema = getschemaclass(source, target)
+    if schema is not None:
+        registration.remove_imports(schema.parent)
 
 
 @handler('typeview', 'uml2fs', 'zcagenerator', 'contenttype', order=100)
 def typeview(self, source, target):
-    schema = getschemaclass(source,target)
-    klass = read_target_node(source, target.target)
+    schema = getschemaclass(source, target)
+    klass = target_node(source, target.target)
     module = schema.parent
     if IModule.providedBy(module):
         directory = module.parent
     else:
         directory = module
-    nsmap = {
-        None: 'http://namespaces.zope.org/zope',
-        'plone': 'http://namespaces.plone.org/plone',
-        'grok': 'http://namespaces.zope.org/grok',
-    }
-    zcmlfile = get_zcml(directory, 'configure.zcml', nsmap=nsmap)
 
-    # include grok:grok directive if not set yet
-    set_zcml_directive(directory, 'configure.zcml',
-                       'grok:grok', 'package', '.')
+    # include grok:grok directive if not set yet, removed in ZCML mode
+    registration.configure_zcml(directory)
 
     classname = '%sView' % klass.classname
     if module.classes(classname):
@@ -393,98 +552,298 @@ def typeview(self, source, target):
         module[uuid.uuid4()] = view
     view.classname = classname
 
-    if not 'dexterity.DisplayForm' in view.bases:
-        view.bases.append('dexterity.DisplayForm')
-
+    template_name = '%s.pt' % klass.classname.lower()
     context = "grok.context(%s)" % schema.classname
     require = "grok.require('zope2.View')"
 
-    context_exists = False
-    require_exists = False
-
-    for block in view.blocks():
-        for line in block.lines:
-            if line == context:
-                context_exists = True
-            if line == require:
-                require_exists = True
-
-    block = python.Block()
-    block.__name__ = str(uuid.uuid4())
-
-    if not context_exists:
-        block.lines.append(context)
-    if not require_exists:
-        block.lines.append(require)
-
-    if block.lines:
-        view.insertfirst(block)
-
     template = False
     for attr in view.attributes():
         if 'template' in attr.targets:
             template = attr
             break
 
-    if not template:
-        template = python.Attribute()
-        template.targets = ['template']
-        view[str(uuid.uuid4())] = template
-
-    template.value = "PageTemplate('templates/%s.pt')" \
-        % klass.classname.lower()
-
+    viewpath = '.%s.%s' % (module.modulename, classname)
     imp = Imports(module)
-    imp.set('plone.directives', [['dexterity', None]])
-    imp.set('five', [['grok', None]])
-    imp.set('grokcore.view.components', [['PageTemplate', None]])
+    if registration.enabled():
+        # view is registered in browser.zcml, template is set there
+        if 'dexterity.DisplayForm' in view.bases:
+            view.bases.remove('dexterity.DisplayForm')
+        if not 'DefaultView' in view.bases:
+            view.bases.append('DefaultView')
+        remove_directives(view, [context, require])
+        if template:
+            view.detach(template.__name__)
+        registration.set_page(
+            directory,
+            '.%s.%s' % (module.modulename, schema.classname),
+            classname.lower(),
+            viewpath,
+            'templates/%s' % template_name,
+            'zope2.View')
+        imp.set('plone.dexterity.browser.view', [['DefaultView', None]])
+    else:
+        if 'DefaultView' in view.bases:
+            view.bases.remove('DefaultView')
+        if not 'dexterity.DisplayForm' in view.bases:
+            view.bases.append('dexterity.DisplayForm')
+        registration.remove_directives(directory, 'browser.zcml',
+                                       'browser:page', 'class', viewpath)
+        remove_directives(view, ['pass'])
+        ensure_directives(view, [context, require])
+        if not template:
+            template = python.Attribute()
+            template.targets = ['template']
+            view[str(uuid.uuid4())] = template
+        template.value = "PageTemplate('templates/%s')" % template_name
+        imp.set('plone.directives', [['dexterity', None]])
+        imp.set('five', [['grok', None]])
+        imp.set('grokcore.view.components', [['PageTemplate', None]])
 
     directory = module.parent
-    template_name = '%s.pt' % klass.classname.lower()
-    template = 'templates/%s' % template_name
     if not 'templates' in directory:
         directory['templates'] = Directory()
 
     templates = directory['templates']
     templates.factories['.pt'] = XMLTemplate
 
+    cached = cached_view_enabled(source)
     if template_name not in templates:
         pt = templates[template_name] = XMLTemplate()
-        pt.template = 'agx.generator.dexterity:templates/displayform.pt'
+        pt.template = view_template(cached)
+        return
+    pt = templates[template_name]
+    if is_stock_template(pt, view_template(not cached)):
+        # template not customized, switch to the one of the view
+        pt.template = view_template(cached)
+    elif cached and not 'view/render_fields' in read_template(pt.abspath):
+        log.warning(u"Template '%s' of cached view '%s' does not render "
+                    u"'view/render_fields'" % (template_name, classname))
+
+
+def view_template(cached):
+    """Return stock template of display view.
+    """
+    if cached:
+        return 'agx.generator.dexterity:templates/cachedview.pt'
+    return 'agx.generator.dexterity:templates/displayform.pt'
+
+
+def read_template(path):
+    try:
+        with open(path) as file:
+            return file.read()
+    except IOError:
+        return ''
+
+
+def is_stock_template(template, stock):
+    """Check whether existing template file equals stock template.
+    """
+    package, subpath = stock.split(':')
+    stock = pkg_resources.resource_filename(package, subpath)
+    return read_template(template.abspath) == read_template(stock)
+
+
+def cached_view_enabled(content_type):
+    """Display view of content type renders fields RAM cached if the
+    ``dexterity:cached_view`` stereotype is applied.
+    """
+    return content_type.stereotype('dexterity:cached_view') is not None
+
+
+def cached_fields(content_type):
+    """Names of fields rendered in cached fragment of display view.
+
+    Fields are selected by ``cache`` tagged value, all fields are cached if
+    none is selected. The cache is keyed on roles of the user and language
+    of the request, thus fields protected by permissions or rendered per
+    language can be cached.
+    """
+    fields = list()
+    selected = list()
+    for prop in content_type.filtereditervalues(IProperty):
+        for group, field_def in field_classification(prop).items():
+            fields.append(prop.name)
+            tgv = tagged_values(prop, field_def['stereotype'])
+            if _bool(tgv.get('cache', 'False')):
+                selected.append(prop.name)
+            break
+    return selected or fields
+
+
+# cache key of cached display views generated before it took roles and
+# language into account, replaced if found
+OUTDATED_CACHEKEY = [
+    'context = self.context',
+    "return ('/'.join(context.getPhysicalPath()), "
+    "str(context.modified()))",
+]
+
+CACHEKEY = [
+    'context = self.context',
+    'user = getSecurityManager().getUser()',
+    "return ('/'.join(context.getPhysicalPath()), "
+    "str(context.modified()),",
+    '        tuple(sorted(user.getRolesInContext(context))),',
+    "        self.request.get('LANGUAGE', ''))",
+]
+
+
+@handler('cachedview', 'uml2fs', 'zcagenerator', 'contenttype', order=105)
+def cachedview(self, source, target):
+    """Render fields of display view with ``plone.memoize`` RAM cache, keyed
+    on path and modification time of the context, roles of the user and
+    language of the request.
+
+    Rendered by ``cachedview.pt`` template.
+    """
+    if not cached_view_enabled(source):
+        return
+    schema = getschemaclass(source, target)
+    klass = target_node(source, target.target)
+    module = schema.parent
+    view = module.classes('%sView' % klass.classname)[0]
+
+    fields = None
+    for attr in view.attributes():
+        if 'cached_fields' in attr.targets:
+            fields = attr
+            break
+    if fields is None:
+        fields = python.Attribute()
+        fields.targets = ['cached_fields']
+        view[str(uuid.uuid4())] = fields
+    fields.value = repr(cached_fields(source))
+
+    if not view.functions('_render_cachekey'):
+        cachekey = python.Function(functionname='_render_cachekey')
+        cachekey.args = ['method', 'self']
+        block = cachekey[str(uuid.uuid4())] = python.Block()
+        block.lines = list(CACHEKEY)
+        view[str(uuid.uuid4())] = cachekey
+    else:
+        for block in view.functions('_render_cachekey')[0].blocks():
+            if block.lines == OUTDATED_CACHEKEY:
+                block.lines = list(CACHEKEY)
+
+    if not view.functions('render_fields'):
+        render = python.Function(functionname='render_fields')
+        render.args.append('self')
+        decorator = python.Decorator('ram.cache')
+        decorator.args.append('_render_cachekey')
+        render[str(uuid.uuid4())] = decorator
+        block = render[str(uuid.uuid4())] = python.Block()
+        block.lines = [
+            'widgets = [widget for widget in self.widgets.values()',
+            '           if widget.__name__ in self.cached_fields]',
+            "return u''.join([widget.render() for widget in widgets])",
+        ]
+        view[str(uuid.uuid4())] = render
+
+    if not view.functions('uncached_widgets'):
+        uncached = python.Function(functionname='uncached_widgets')
+        uncached.args.append('self')
+        block = uncached[str(uuid.uuid4())] = python.Block()
+        block.lines = [
+            'return [widget for widget in self.widgets.values()',
+            '        if widget.__name__ not in self.cached_fields]',
+        ]
+        view[str(uuid.uuid4())] = uncached
+
+    Imports(module).set('plone.memoize', [['ram', None]])
+    Imports(module).set('AccessControl', [['getSecurityManager', None]])
+
+
+@handler('catalogindexers', 'uml2fs', 'zcagenerator', 'contenttype',
+         order=120)
+def catalogindexers(self, source, target):
+    """Create ``plone.indexer`` adapters for indexed fields of content type.
+
+    Metadata columns read the attribute of the object, fields stored as
+    metadata only need no indexer.
+    """
+    fields = [field for field in catalog_fields(source) if field.index]
+    if not fields:
+        return
+    schema = getschemaclass(source, target)
+    module = schema.parent
+    for field in fields:
+        functionname = '%s_indexer' % field.name
+        if module.functions(functionname):
+            indexer = module.functions(functionname)[0]
+        else:
+            indexer = python.Function(functionname=functionname)
+            indexer.args.append('obj')
+            decorator = python.Decorator('indexer')
+            decorator.args.append(schema.classname)
+            indexer[str(uuid.uuid4())] = decorator
+            block = indexer[str(uuid.uuid4())] = python.Block()
+            block.lines.append('return obj.%s' % field.name)
+            module[str(uuid.uuid4())] = indexer
+        adapter = "grok.global_adapter(%s, name='%s')" % (functionname,
+                                                           field.name)
+        factory = '.%s.%s' % (module.modulename, functionname)
+        if registration.enabled():
+            remove_directives(module, [adapter])
+            registration.set_adapter(module.parent, factory, field.name)
+        else:
+            registration.remove_directives(module.parent, 'configure.zcml',
+                                           'adapter', 'factory', factory)
+            ensure_directives(module, [adapter], insert=indexer)
+    imp = Imports(module)
+    imp.set('plone.indexer', [['indexer', None]])
+    if not registration.enabled():
+        imp.set('five', [['grok', None]])
 
 
 def templatepath(name):
     return os.path.join(os.path.dirname(__file__), 'templates/%s' % name)
 
 
+# template data read once per process, shared by all generated files
+_template_data = dict()
+
+
+def template_data(name):
+    """Return binary contents of template.
+    """
+    data = _template_data.get(name)
+    if data is None:
+        with open(templatepath(name), 'rb') as template:
+            data = _template_data[name] = template.read()
+    return data
+
+
+# icon resources shared by all content types if ``shared_icons`` is enabled
+shared_icons = {
+    True: 'dexterity_container.png',
+    False: 'dexterity_item.png',
+}
+
+
 @handler('typeicon', 'uml2fs', 'plonegenerator', 'contenttype', order=100)
 def typeicon(self, source, target):
     egg = egg_source(source)
-    package = read_target_node(egg, target.target)
+    package = target_node(egg, target.target)
     resources = package['resources']
-    icon = '%s_icon.png' % source.name.lower()
-    klass = read_target_node(source,target.target)
+    klass = target_node(source, target.target)
     folderish = token(str(klass.uuid), True, folderish=False).folderish
+    # shared icons are enabled by ``shared_icons`` option of the run
+    if current().shared_icons:
+        icon = shared_icons[folderish]
+        # reference shared icon in FTI
+        fti = lookup_fti(source, target.target)
+        fti.content_icon = '++resource++%s/%s' % (egg.name, icon)
+    else:
+        icon = '%s_icon.png' % source.name.lower()
     if not icon in resources:
-        default = package['profiles']['default']
-        type_name = type_id(source, target.target)
-        name = '%s.xml' % type_name
-
-        fti = default['types'][name]
         if folderish:
-            path = templatepath('folder_icon.png')
+            name = 'folder_icon.png'
         else:
-            path = templatepath('document_icon.png')
-
+            name = 'document_icon.png'
         file = resources[icon] = File()
         file.mode = MODE_BINARY
-        with open(path) as template:
-            file.data = template.read()
-
-
-class IDexterityType(IClass):
-    """Marker.
-    """
+        file.data = template_data(name)
 
 
 @handler('schemaumlclass', 'xmi2uml', 'finalizegenerator', 'class')
@@ -497,28 +856,47 @@ def schemaumlclass(self, source, target):
 
 @handler('schemaclass', 'uml2fs', 'zcagenerator', 'contenttype', order=110)
 def schemaclass(self, source, target):
-    schema = getschemaclass(source,target)
-    klass = read_target_node(source, target.target)
+    schema = getschemaclass(source, target)
+    klass = target_node(source, target.target)
     module = schema.parent
 
     view = module.classes('%sView' % klass.classname)[0]
     tok = token(str(view.uuid), True, depends_on=set())
     tok.depends_on.add(schema)
 
-    if not 'form.Schema' in schema.bases:
-        schema.bases.append('form.Schema')
+    base_import = set_schema_base(schema)
 
     egg = egg_source(source)
 
     imp = Imports(schema.parent)
     imp.set(egg.name, [['_', None]])
-    imp.set('plone.directives', [['form', None]])
+    imp.set(*base_import)
+
+
+def set_schema_base(schema):
+    """Base schema on ``form.Schema`` of ``plone.directives``, or on
+    ``model.Schema`` of ``plone.supermodel`` in ZCML mode, which does not
+    import grok.
+
+    Return import of base as arguments of ``Imports.set``.
+    """
+    if registration.enabled():
+        base, other = 'model.Schema', 'form.Schema'
+        base_import = ('plone.supermodel', [['model', None]])
+    else:
+        base, other = 'form.Schema', 'model.Schema'
+        base_import = ('plone.directives', [['form', None]])
+    if other in schema.bases:
+        schema.bases.remove(other)
+    if not base in schema.bases:
+        schema.bases.append(base)
+    return base_import
 
 
 @handler('typemodulesorter', 'uml2fs', 'zcasemanticsgenerator', 
          'contenttype', order=100)
 def dependencysorter(self, source, target):
-    schema = getschemaclass(source,target)
+    schema = getschemaclass(source, target)
     module = schema.parent
     sort_classes_in_module(module)
 
@@ -537,11 +915,6 @@ def dxpackagedependencies(self, source, target):
 ###############################################################################
 
 
-class IDexterityBehavior(IClass):
-    """Marker.
-    """
-
-
 @handler('behaviorumlclass', 'xmi2uml', 'finalizegenerator', 'class')
 def behaviorumlclass(self, source, target):
     class_ = read_target_node(source, target.target)
@@ -552,46 +925,138 @@ def behaviorumlclass(self, source, target):
 
 @handler('behaviorschema', 'uml2fs', 'zcagenerator', 'dxbehavior', order=100)
 def behaviorschema(self, source, target):
-    schema = read_target_node(source, target.target)
+    schema = target_node(source, target.target)
     module = schema.parent
 
     # check whether this behavior has schema attributes
-    if not 'form.Schema' in schema.bases:
-        schema.bases.append('form.Schema')
+    base_import = set_schema_base(schema)
 
-    alsoprovides = "alsoProvides(%s, form.IFormFieldProvider)" \
-        % schema.classname
+    alsoprovides = [
+        "alsoProvides(%s, form.IFormFieldProvider)" % schema.classname,
+        "alsoProvides(%s, IFormFieldProvider)" % schema.classname,
+    ]
+    if registration.enabled():
+        alsoprovides.reverse()
+    remove_directives(module, alsoprovides[1:])
+    ensure_directives(module, alsoprovides[:1], insert=schema)
 
-    alsoprovides_exists = False
+    egg = egg_source(source)
 
-    for block in module.blocks():
-        for line in block.lines:
-            if line == alsoprovides:
-                alsoprovides_exists = True
+    imp = Imports(schema.parent)
+    imp.set(egg.name, [['_', None]])
+    imp.set(*base_import)
+    if registration.enabled():
+        imp.set('plone.autoform.interfaces', [['IFormFieldProvider', None]])
+    imp.set('zope.interface', [['alsoProvides', None]])
 
-    block = python.Block()
-    block.__name__ = str(uuid.uuid4())
 
-    if not alsoprovides_exists:
-        block.lines.append(alsoprovides)
+@handler('behaviorimports', 'uml2fs', 'dxcleanupgenerator', 'dxbehavior',
+         order=110)
+def behaviorimports(self, source, target):
+    """Remove imports of the other registration mode from behavior module.
+    """
+    registration.remove_imports(target_node(source, target.target).parent)
 
-    if block.lines:
-        module.insertafter(block, schema)
 
-    egg = egg_source(source)
+# storage strategies of behaviors, set by ``storage`` tagged value of
+# ``dexterity:behavior``
+#
+# adapter:
+#     generated adapter class, fields are implemented there
+# schema:
+#     schema only behavior, schema is applied as marker and fields are stored
+#     as attributes of the context
+# annotation:
+#     fields are stored in annotations of the context
+BEHAVIOR_STORAGES = ('adapter', 'schema', 'annotation')
+
+
+def behavior_storage(source):
+    """Storage strategy of behavior.
+    """
+    storage = tagged_values(source, 'dexterity:behavior').get('storage')
+    if not storage:
+        return 'adapter'
+    if storage not in BEHAVIOR_STORAGES:
+        raise RuntimeError(u"Unknown behavior storage '%s' of '%s', expected "
+                           u"one of %s" % (storage, source.name,
+                                           ', '.join(BEHAVIOR_STORAGES)))
+    return storage
 
-    imp = Imports(schema.parent)
-    imp.set(egg.name, [['_', None]])
-    imp.set('plone.directives', [['form', None]])
-    imp.set('zope.interface', [['alsoProvides', None]])
+
+def behaviormarker(source, module):
+    """Create marker interface named by ``marker`` tagged value.
+
+    @return: marker interface name or None
+    """
+    name = tagged_values(source, 'dexterity:behavior').get('marker')
+    if not name:
+        return None
+    if not module.classes(name):
+        marker = python.Class(classname=name)
+        marker.bases.append('Interface')
+        module[str(uuid.uuid4())] = marker
+    Imports(module).set('zope.interface', [['Interface', None]])
+    return name
 
 
 @handler('behavioradapter', 'uml2fs', 'zcagenerator', 'dxbehavior', order=110)
 def behavioradapter(self, source, target):
-    schema = read_target_node(source, target.target)
+    schema = target_node(source, target.target)
     module = schema.parent
-
+    storage = behavior_storage(source)
+    provides = '.%s.%s' % (module.modulename, schema.classname)
     adaptername = schema.classname[1:]
+
+    if storage == 'adapter':
+        factory = '.%s.%s' % (module.modulename, adaptername)
+        behavioradapterclass(module, schema, adaptername)
+        marker = behaviormarker(source, module)
+    elif storage == 'annotation':
+        factory = 'plone.behavior.AnnotationStorage'
+        marker = behaviormarker(source, module)
+    else:
+        # schema is its own marker, no factory needed
+        factory = None
+        marker = schema.classname
+    if marker:
+        marker = '.%s.%s' % (module.modulename, marker)
+
+    # read or create configure.zcml
+    package = module.parent
+    if 'configure.zcml' in package:
+        configure = registration.normalize(package['configure.zcml'])
+    else:
+        path = package.path
+        path.append('configure.zcml')
+        fullpath = os.path.join(*path)
+        configure = ZCMLFile(fullpath)
+        configure.nsmap.update(registration.nsmap())
+        package['configure.zcml'] = configure
+
+    behaviors = configure.filter(tag='plone:behavior',
+                                 attr='provides',
+                                 value=provides)
+    if behaviors:
+        behavior = behaviors[0]
+    else:
+        behavior = SimpleDirective(name='plone:behavior', parent=configure)
+        behavior.attrs['title'] = adaptername
+        # XXX: stereotype tgv
+        behavior.attrs['description'] = adaptername
+        behavior.attrs['provides'] = provides
+    registration.set_attr(behavior, 'factory', factory)
+    registration.set_attr(behavior, 'marker', marker)
+    if storage == 'annotation':
+        registration.set_attr(behavior, 'for',
+                              'zope.annotation.interfaces.IAnnotatable')
+    else:
+        registration.set_attr(behavior, 'for', None)
+
+
+def behavioradapterclass(module, schema, adaptername):
+    """Create adapter class of behavior storing its context.
+    """
     if module.classes(adaptername):
         adapter = module.classes(adaptername)[0]
     else:
@@ -600,20 +1065,7 @@ def behavioradapter(self, source, target):
     adapter.classname = adaptername
 
     implements = "implements(%s)" % schema.classname
-    implements_exists = False
-    for block in adapter.blocks():
-        for line in block.lines:
-            if line == implements:
-                implements_exists = True
-
-    block = python.Block()
-    block.__name__ = str(uuid.uuid4())
-
-    if not implements_exists:
-        block.lines.append(implements)
-
-    if block.lines:
-        adapter.insertfirst(block)
+    ensure_directives(adapter, [implements])
 
     # ``__init__ only created once``
     # XXX: check if signature changed and raise error
@@ -626,30 +1078,3 @@ def behavioradapter(self, source, target):
 
     imp = Imports(module)
     imp.set('zope.interface', [['implements', None]])
-
-    # read or create configure.zcml
-    package = module.parent
-    if 'configure.zcml' in package:
-        configure = package['configure.zcml']
-    else:
-        path = package.path
-        path.append('configure.zcml')
-        fullpath = os.path.join(*path)
-        configure = ZCMLFile(fullpath)
-        configure.nsmap['plone'] = 'http://namespaces.plone.org/plone'
-        configure.nsmap['grok'] = 'http://namespaces.zope.org/grok'
-        package['configure.zcml'] = configure
-
-    provides = '.%s.%s' % (module.modulename, schema.classname)
-    factory = '.%s.%s' % (module.modulename, adapter.classname)
-
-    # XXX: maybe more filters
-    if not configure.filter(tag='plone:behavior',
-                            attr='factory',
-                            value=factory):
-        behavior = SimpleDirective(name='plone:behavior', parent=configure)
-        behavior.attrs['title'] = adapter.classname
-        # XXX: stereotype tgv
-        behavior.attrs['description'] = adapter.classname
-        behavior.attrs['provides'] = provides
-        behavior.attrs['factory'] = factory
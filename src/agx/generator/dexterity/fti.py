@@ -0,0 +1,211 @@
+import os
+from lxml import etree
+from odict import odict
+from node.ext.directory import Directory
+from node.ext.template import DTMLTemplate
+from agx.generator.dexterity.utils import (
+    target_node,
+    egg_source,
+    type_id,
+)
+
+
+# method aliases and actions shared by all FTIs. stored as tuples, converted
+# to the dicts expected by ``agx.generator.plone:templates/type.xml`` when
+# rendering
+DEFAULT_ALIASES = (
+    ('(Default)', '(dynamic view)'),
+    ('view', '(selected layout)'),
+    ('edit', '@@edit'),
+    ('sharing', '@@sharing'),
+)
+
+ACTION_KEYS = ('action_id', 'title', 'category', 'condition_expr',
+               'url_expr', 'visible', 'permissions')
+
+DEFAULT_ACTIONS = (
+    ('edit', 'Edit', 'object', '', 'string:${object_url}/edit', 'True',
+     ('Modify portal content',)),
+    ('view', 'View', 'object', '', 'string:${object_url}/view', 'True',
+     ('View',)),
+)
+
+
+class OrderedSet(object):
+    """Sequence ignoring duplicates, keeps insertion order.
+    """
+    __slots__ = ('_items', '_index')
+
+    def __init__(self, items=()):
+        self._items = list()
+        self._index = set()
+        self.update(items)
+
+    def add(self, item):
+        if item not in self._index:
+            self._index.add(item)
+            self._items.append(item)
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return '<OrderedSet %r>' % self._items
+
+
+class FTI(object):
+    """Dexterity factory type information of a content type.
+
+    FTI properties not covered by attributes can be added to ``properties``.
+    """
+    __slots__ = ('name', 'i18n_domain', 'title', 'description',
+                 'content_icon', 'allow_discussion', 'global_allow',
+                 'filter_content_types', 'allowed_content_types', 'schema',
+                 'klass', 'add_permission', 'behaviors', 'view_methods',
+                 'default_view', 'default_view_fallback', 'aliases',
+                 'actions', 'properties')
+
+    meta_type = 'Dexterity FTI'
+
+    def __init__(self, name, i18n_domain, title=None, description=None):
+        self.name = name
+        self.i18n_domain = i18n_domain
+        # basic metadata
+        self.title = title or name
+        self.description = description or self.title
+        self.content_icon = None
+        self.allow_discussion = 'False'
+        self.global_allow = 'True'
+        # XXX: maybe False for non contained ones?
+        self.filter_content_types = 'True'
+        self.allowed_content_types = OrderedSet()
+        # dexterity specific
+        self.schema = None
+        self.klass = 'plone.dexterity.content.Item'
+        self.add_permission = 'cmf.AddPortalContent'
+        self.behaviors = OrderedSet()
+        # view information
+        self.view_methods = OrderedSet(['view'])
+        self.default_view = 'view'
+        self.default_view_fallback = 'False'
+        # method aliases and actions, shared unless overridden
+        self.aliases = DEFAULT_ALIASES
+        self.actions = DEFAULT_ACTIONS
+        self.properties = odict()
+
+    def params(self):
+        """Template params for ``agx.generator.plone:templates/type.xml``.
+        """
+        ctype = dict()
+        for name in self.__slots__:
+            if name in ('aliases', 'actions', 'properties'):
+                continue
+            value = getattr(self, name)
+            if isinstance(value, OrderedSet):
+                value = list(value)
+            ctype[name] = value
+        ctype['meta_type'] = self.meta_type
+        ctype['aliases'] = [{'from': from_, 'to': to}
+                            for from_, to in self.aliases]
+        ctype['actions'] = [dict(zip(ACTION_KEYS, action))
+                            for action in self.actions]
+        for name, value in self.properties.items():
+            ctype['fti:%s' % name] = value
+        return ctype
+
+
+def ftis(default):
+    """Return odict of FTI records by type id collected for GenericSetup
+    profile directory.
+
+    Records are collected once per run and written by ``render``.
+    """
+    try:
+        return default.__dict__['_agx_dexterity_ftis']
+    except KeyError:
+        return default.__dict__.setdefault('_agx_dexterity_ftis', odict())
+
+
+def lookup_fti(content_type, target):
+    """Return FTI record of content type.
+    """
+    package = target_node(egg_source(content_type), target)
+    default = package['profiles']['default']
+    return ftis(default)[type_id(content_type, target)]
+
+
+def render(default, merge=False):
+    """Write collected FTI records to ``types.xml`` and ``TYPENAME.xml``.
+
+    @param merge: flag whether types of ``types.xml`` not generated are
+        kept, set if the model got restricted
+    """
+    records = ftis(default)
+    if not records:
+        return
+
+    # create types foder if not exists
+    if not 'types' in default:
+        default['types'] = Directory()
+    directory = default['types']
+
+    # read or create types.xml
+    if 'types.xml' in default:
+        types = default['types.xml']
+    else:
+        types = default['types.xml'] = DTMLTemplate()
+    types.template = 'agx.generator.plone:templates/types.xml'
+    portal_types = [{
+        'name': fti.name,
+        'meta_type': fti.meta_type,
+    } for fti in records.values()]
+    if merge:
+        portal_types = merge_types(default, portal_types)
+    types.params['portalTypes'] = portal_types
+
+    # read or create TYPENAME.xml
+    existing = set(directory.keys())
+    for fti in records.values():
+        name = '%s.xml' % fti.name
+        if name in existing:
+            type = directory[name]
+        else:
+            type = directory[name] = DTMLTemplate()
+        type.template = 'agx.generator.plone:templates/type.xml'
+        type.params['ctype'] = fti.params()
+
+
+def existing_types(default):
+    """Read ``name`` and ``meta_type`` of types listed in ``types.xml`` on
+    the file system.
+    """
+    path = os.path.join(*default.fs_path + ['types.xml'])
+    if not os.path.exists(path):
+        return list()
+    return [{
+        'name': node.get('name'),
+        'meta_type': node.get('meta_type'),
+    } for node in etree.parse(path).getroot().findall('object')]
+
+
+def merge_types(default, portal_types):
+    """Merge types of ``types.xml`` on the file system with portal_types.
+
+    Order of existing types is kept, new ones are appended.
+    """
+    current = dict([(type['name'], type) for type in portal_types])
+    merged = list()
+    for type in existing_types(default):
+        merged.append(current.pop(type['name'], type))
+    merged += [type for type in portal_types if type['name'] in current]
+    return merged
@@ -0,0 +1,170 @@
+import os
+import hashlib
+from node.ext.directory import File
+from agx.core.util import dotted_path
+from agx.generator.dexterity.utils import relations
+from agx.generator.dexterity.options import current
+from agx.generator.dexterity import selection
+from node.ext.uml.interfaces import (
+    IAssociation,
+    IStereotype,
+)
+
+
+# bump if generated output changes, invalidates all stored fingerprints
+FINGERPRINT_VERSION = '2'
+
+# name of the file in the target root fingerprints get stored to
+FINGERPRINTS = '.agx_dexterity_fingerprints'
+
+# attributes of UML elements taken into account for fingerprints. values
+# of reference attributes are UML elements and represented by their XMI id,
+# other values than literals (i.e. marker objects) are ignored
+_element_attributes = ['value', 'default', 'type', 'general', 'contract',
+                       'client', 'supplier', 'aggregationkind', 'lowervalue',
+                       'uppervalue', 'navigable']
+
+_literals = (basestring, int, long, float)
+
+
+def enabled():
+    """Incremental mode is enabled by ``incremental`` option of the run.
+    """
+    return current().incremental
+
+
+def _ident(node):
+    """Identify node independent from generation run. Unnamed elements get
+    an uuid as name, use XMI id and name if available.
+    """
+    if node.xmiid is not None:
+        return '%s:%s' % (node.xmiid, node.xminame)
+    return str(node.name)
+
+
+def _describe(node, lines, depth=0):
+    """Append description of node and its children to lines.
+    """
+    line = ['  ' * depth, node.__class__.__name__, _ident(node)]
+    for name in _element_attributes:
+        value = getattr(node, name, None)
+        if hasattr(value, 'path'):
+            value = _ident(value)
+        elif not isinstance(value, _literals):
+            continue
+        line.append('%s=%r' % (name, value))
+    lines.append(' '.join(line))
+    for child in node.values():
+        _describe(child, lines, depth + 1)
+
+
+def _describe_end(node, lines):
+    """Append description of an element related to a content type. Only
+    dotted path and stereotypes are relevant for the content type's FTI.
+    """
+    lines.append('end %s' % dotted_path(node))
+    for stereotype in node.filtereditervalues(IStereotype):
+        _describe(stereotype, lines, 1)
+
+
+def fingerprint(source):
+    """Fingerprint of content type, behavior or dynamic view UML class.
+
+    Covers the class subtree with properties, stereotypes and tagged values,
+    as well as associations and dependencies the class is part of.
+    """
+    lines = [FINGERPRINT_VERSION]
+    # options changing the output of all types
+    options = current()
+    lines.append('zcml=%s blobs=%s shared_icons=%s' % (
+        options.zcml, options.blobs, options.shared_icons))
+    _describe(source, lines)
+    for relation in relations(source.root).get(source.uuid, list()):
+        _describe(relation, lines)
+        if IAssociation.providedBy(relation):
+            ends = [end.type for end in relation.memberEnds]
+        else:
+            ends = [relation.client, relation.supplier]
+        for end in ends:
+            if end is not None and end is not source:
+                _describe_end(end, lines)
+    return hashlib.sha1('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+def read_fingerprints(outdir):
+    """Read fingerprints stored by the last run in outdir.
+
+    @return: dict of fingerprints by dotted path of class
+    """
+    path = os.path.join(outdir, FINGERPRINTS)
+    ret = dict()
+    if not os.path.exists(path):
+        return ret
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                name, digest = line.split()
+                ret[name] = digest
+    return ret
+
+
+def fingerprints(model):
+    """Return dict of dotted path and fingerprint of selectable classes of
+    model by uuid.
+
+    Computed once per model, before it gets restricted to selected types.
+    """
+    ret = model.__dict__.get('_agx_dexterity_fingerprints')
+    if ret is None:
+        ret = model.__dict__['_agx_dexterity_fingerprints'] = dict()
+        for class_ in selection.selectable(model):
+            ret[class_.uuid] = (dotted_path(class_), fingerprint(class_))
+    return ret
+
+
+def restrict(model, outdir):
+    """Remove classes from model which did not change since the last run
+    generating into outdir.
+
+    Changed classes are kept along with the classes they depend on. Runs
+    after the model got restricted to selected types. Fingerprints to
+    store are kept on the model for ``store``.
+
+    @param model: UML model
+    @param outdir: output directory
+    """
+    computed = fingerprints(model)
+    previous = read_fingerprints(outdir)
+    generated = selection.selectable(model)
+    names = set([name for name, digest in computed.values()])
+    removed = set(previous) - names
+    # fingerprints of classes not generated are kept, the ones of classes
+    # removed from the model as long as the run is selective
+    stored = dict(previous)
+    if not selection.enabled():
+        for name in removed:
+            del stored[name]
+    for class_ in generated:
+        name, digest = computed[class_.uuid]
+        stored[name] = digest
+    model.__dict__['_agx_dexterity_stored'] = stored
+    # output of removed classes is cleaned up by a full run
+    if not previous or removed:
+        return
+    changed = [class_ for class_ in generated
+               if previous.get(computed[class_.uuid][0]) !=
+                  computed[class_.uuid][1]]
+    selection.prune(model, selection.dependencies(model, changed))
+
+
+def store(model, target):
+    """Write fingerprints computed by ``restrict`` to the target root.
+    """
+    stored = model.__dict__.get('_agx_dexterity_stored')
+    if stored is None:
+        return
+    root = target.root
+    if FINGERPRINTS not in root:
+        root[FINGERPRINTS] = File()
+    root[FINGERPRINTS].lines = ['%s %s' % item
+                                for item in sorted(stored.items())] + ['']
@@ -0,0 +1,553 @@
+import os
+import gc
+import sys
+import json
+import heapq
+import resource
+from contextlib import contextmanager
+from timeit import default_timer
+from odict import odict
+from zope.component import (
+    getUtility,
+    getUtilitiesFor,
+)
+from agx.core import (
+    Generator,
+    Processor,
+)
+from agx.core.interfaces import (
+    IConfLoader,
+    IHandler,
+)
+from agx.core.util import dotted_path
+try:
+    # python >= 3.4 or pytracemalloc
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+_generator_call = Generator.__call__
+
+# active phase observers
+_observers = list()
+
+
+def _observed_call(self, source, target):
+    observers = list(_observers)
+    for observer in observers:
+        observer.begin(self.name)
+    try:
+        _generator_call(self, source, target)
+    finally:
+        for observer in reversed(observers):
+            observer.end(self.name)
+
+
+def add_observer(observer):
+    """Notify observer about generator phases.
+
+    ``observer.begin(name)`` is called before and ``observer.end(name)``
+    after each generator runs, ``name`` is the full generator name, i.e.
+    ``uml2fs.zcagenerator``. Generators run unobserved as long as no
+    observer is added.
+    """
+    _observers.append(observer)
+    Generator.__call__ = _observed_call
+
+
+def remove_observer(observer):
+    _observers.remove(observer)
+    if not _observers:
+        Generator.__call__ = _generator_call
+
+
+@contextmanager
+def observe_phases(observer):
+    """Notify observer about generator phases while context is active.
+    """
+    add_observer(observer)
+    try:
+        yield observer
+    finally:
+        remove_observer(observer)
+
+
+class PhaseTimer(object):
+    """Phase observer recording wall time per generator.
+    """
+
+    def __init__(self):
+        self.timings = odict()
+        self._started = dict()
+
+    def begin(self, name):
+        self._started[name] = default_timer()
+
+    def end(self, name):
+        duration = default_timer() - self._started.pop(name)
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+
+def last_phase():
+    """Return name of the generator finishing a run, the last one of the last
+    transform.
+    """
+    transforms = getUtility(IConfLoader).transforms
+    return Processor(transforms[-1]).lookup_generators()[-1].name
+
+
+# modules whose handlers are profiled by default
+PROFILED_MODULES = (
+    'agx.generator.dexterity.dxgenerator',
+    'agx.generator.dexterity.gsgenerator',
+)
+
+
+class HandlerStats(object):
+    """Call count, cumulative and max time and slowest source nodes of a
+    handler.
+    """
+    __slots__ = ('name', 'calls', 'total', 'max', 'slowest', 'keep')
+
+    def __init__(self, name, keep=5):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        # min heap of ``(duration, source path)``
+        self.slowest = list()
+        self.keep = keep
+
+    def add(self, duration, source):
+        self.calls += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        # source path is computed for candidates of slowest nodes only
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, (duration, dotted_path(source)))
+        elif duration > self.slowest[0][0]:
+            heapq.heappushpop(self.slowest, (duration, dotted_path(source)))
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'total': self.total,
+            'max': self.max,
+            'slowest': [{'duration': duration, 'source': path}
+                        for duration, path in sorted(self.slowest,
+                                                     reverse=True)],
+        }
+
+
+class HandlerObserver(object):
+    """Base for phase observers wrapping handlers of modules.
+
+    Handlers are registered lazily, thus they are wrapped at the beginning of
+    each generator phase. Wrapped handlers are restored by ``uninstall``.
+
+    If ``path`` is given, the report is written to it and the observer is
+    reset each time a run finishes, thus the file contains the report of the
+    last run.
+    """
+
+    def __init__(self, modules=PROFILED_MODULES, path=None):
+        self.modules = modules
+        self.path = path
+        self._wrapped = dict()
+        # name of the phase finishing the run in progress
+        self._last = None
+
+    def wrap(self, name, func):
+        """Return wrapper of handler function, the function itself by
+        default.
+        """
+        return func
+
+    def install(self):
+        for name, handler in getUtilitiesFor(IHandler):
+            if name in self._wrapped:
+                continue
+            func = handler.__dict__.get('_callfunc')
+            if func is None or func.__module__ not in self.modules:
+                continue
+            self._wrapped[name] = (handler, func)
+            handler._callfunc = self.wrap(name, func)
+
+    def uninstall(self):
+        for handler, func in self._wrapped.values():
+            handler._callfunc = func
+        self._wrapped.clear()
+
+    def reset(self):
+        """Discard recorded data.
+        """
+        self.uninstall()
+
+    def started(self):
+        """Called when a run starts.
+        """
+
+    def finished(self):
+        """Called when a run finished.
+        """
+        if self.path:
+            self.write(self.path)
+            self.reset()
+
+    def begin(self, name):
+        if self._last is None:
+            self._last = last_phase()
+            self.started()
+        self.install()
+
+    def end(self, name):
+        if name == self._last:
+            self._last = None
+            self.finished()
+
+
+class HandlerProfile(HandlerObserver):
+    """Phase observer profiling handlers of modules.
+    """
+
+    def __init__(self, modules=PROFILED_MODULES, keep=5, path=None):
+        super(HandlerProfile, self).__init__(modules, path)
+        self.keep = keep
+        self.stats = dict()
+
+    def reset(self):
+        # wrappers refer to stats of the finished run, handlers get wrapped
+        # again at the beginning of the next one
+        super(HandlerProfile, self).reset()
+        self.stats = dict()
+
+    def wrap(self, name, func):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = HandlerStats(name, self.keep)
+        def timed(handler, source, target):
+            start = default_timer()
+            try:
+                func(handler, source, target)
+            finally:
+                stats.add(default_timer() - start, source)
+        return timed
+
+    def sorted(self, key='total'):
+        return sorted(self.stats.values(),
+                      key=lambda stats: getattr(stats, key), reverse=True)
+
+    def as_dict(self):
+        return dict([(stats.name, stats.as_dict())
+                     for stats in self.stats.values()])
+
+    def report(self, key='total'):
+        """Text report of handlers sorted by key.
+        """
+        lines = ['%-60s %8s %10s %10s' % ('handler', 'calls', 'total', 'max')]
+        for stats in self.sorted(key):
+            lines.append('%-60s %8i %10.4f %10.4f' % (
+                stats.name, stats.calls, stats.total, stats.max))
+            for duration, path in sorted(stats.slowest, reverse=True):
+                lines.append('    %10.4f %s' % (duration, path))
+        return '\n'.join(lines)
+
+    def write(self, path):
+        """Write report to path, JSON if path ends with ``.json``.
+        """
+        with open(path, 'w') as file:
+            if path.endswith('.json'):
+                json.dump(self.as_dict(), file, indent=2, sort_keys=True)
+            else:
+                file.write(self.report() + '\n')
+
+
+def profile_handlers_path():
+    """Handlers are profiled if ``AGX_DEXTERITY_PROFILE_HANDLERS`` is set
+    to the path the report is written to when a run finishes.
+    """
+    return os.environ.get('AGX_DEXTERITY_PROFILE_HANDLERS')
+
+
+_profile = None
+
+
+def profile_handlers():
+    """Profile handlers of the dexterity generator if enabled.
+    """
+    global _profile
+    path = profile_handlers_path()
+    if not path or _profile is not None:
+        return
+    _profile = HandlerProfile(path=os.path.abspath(path))
+    add_observer(_profile)
+
+
+# phases at whose end memory is accounted. the end of ``xmi2uml`` separates
+# the UML tree from target nodes
+MEMORY_BOUNDARIES = (
+    'xmi2uml.finalizegenerator',
+    'uml2fs.connectorgenerator',
+    'uml2fs.zcagenerator',
+    'uml2fs.plonegenerator',
+    'uml2fs.dxcleanupgenerator',
+)
+
+
+def peak_rss():
+    """Peak resident set size of the process in KiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on mac os
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak
+
+
+_pagesize = resource.getpagesize()
+
+
+def current_rss():
+    """Current resident set size of the process in KiB.
+
+    Read from ``/proc/self/statm``. Where it is not available, the peak
+    resident set size is returned, which grows only.
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * _pagesize / 1024
+    except (IOError, IndexError, ValueError):
+        return peak_rss()
+
+
+def count_objects():
+    """Count objects tracked by the garbage collector by type.
+    """
+    counts = dict()
+    for ob in gc.get_objects():
+        cls = getattr(ob, '__class__', type(ob))
+        name = '%s.%s' % (cls.__module__, cls.__name__)
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+class MemorySnapshot(object):
+    """Memory state at the end of a generator phase.
+    """
+    __slots__ = ('phase', 'objects', 'rss', 'peak_rss', 'traced', 'peak',
+                 'allocations', '_snapshot')
+
+    def __init__(self, phase, previous=None, limit=10):
+        self.phase = phase
+        self.objects = count_objects()
+        self.rss = current_rss()
+        self.peak_rss = peak_rss()
+        self.traced = self.peak = None
+        self.allocations = list()
+        # tracemalloc snapshot, kept for comparison with the next one only
+        self._snapshot = None
+        if tracemalloc is None or not tracemalloc.is_tracing():
+            return
+        self.traced, self.peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+        if previous is not None and previous._snapshot is not None:
+            stats = snapshot.compare_to(previous._snapshot, 'lineno')
+        else:
+            stats = snapshot.statistics('lineno')
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            size = getattr(stat, 'size_diff', stat.size)
+            self.allocations.append((size, '%s:%i' % (frame.filename,
+                                                       frame.lineno)))
+        self._snapshot = snapshot
+
+    def growth(self, previous, limit=10):
+        """Object count growth by type since previous snapshot.
+        """
+        before = previous is not None and previous.objects or dict()
+        growth = [(count - before.get(name, 0), name)
+                  for name, count in self.objects.items()]
+        growth = [item for item in growth if item[0] > 0]
+        return sorted(growth, reverse=True)[:limit]
+
+
+class HandlerMemory(object):
+    """Memory growth accounted to a handler over all its calls.
+
+    ``objects`` is the growth of objects tracked by the garbage collector,
+    ``rss`` the growth of the resident set size in KiB, ``traced`` the
+    growth of memory traced by ``tracemalloc`` in bytes, None if not
+    tracing.
+    """
+    __slots__ = ('name', 'calls', 'objects', 'rss', 'traced')
+
+    def __init__(self, name, traced=False):
+        self.name = name
+        self.calls = 0
+        self.objects = 0
+        self.rss = 0
+        self.traced = traced and 0 or None
+
+
+def _kib(size, sign=True):
+    return (sign and '%+.1f KiB' or '%.1f KiB') % (size / 1024.0)
+
+
+class MemoryAccounting(HandlerObserver):
+    """Phase observer taking memory snapshots at phase boundaries and
+    accounting memory growth to handlers.
+
+    Object counts by type, current and peak RSS of the process are recorded
+    at boundaries. Growth of tracked objects and of RSS is accounted to each
+    call of a handler. If ``tracemalloc`` is tracing, top allocations by
+    line between boundaries and traced memory growth per handler are
+    recorded too. Python 2 lacks ``tracemalloc`` unless the
+    ``pytracemalloc`` backport is used.
+
+    Counting objects per handler call walks all objects tracked by the
+    garbage collector, thus accounting slows down generation considerably.
+    """
+
+    def __init__(self, modules=PROFILED_MODULES,
+                 boundaries=MEMORY_BOUNDARIES, limit=10, path=None):
+        super(MemoryAccounting, self).__init__(modules, path)
+        self.boundaries = boundaries
+        self.limit = limit
+        self.baseline = None
+        self.snapshots = list()
+        # handler name -> ``HandlerMemory``
+        self.handlers = dict()
+
+    def start(self):
+        """Take baseline snapshot growth of first boundary is compared to.
+        """
+        self.baseline = MemorySnapshot('start', limit=self.limit)
+
+    def started(self):
+        if self.baseline is None:
+            self.start()
+
+    def reset(self):
+        super(MemoryAccounting, self).reset()
+        self.baseline = None
+        self.snapshots = list()
+        self.handlers = dict()
+
+    @property
+    def tracing(self):
+        return tracemalloc is not None and tracemalloc.is_tracing()
+
+    def wrap(self, name, func):
+        tracing = self.tracing
+        record = self.handlers.get(name)
+        if record is None:
+            record = self.handlers[name] = HandlerMemory(name, tracing)
+        def accounted(handler, source, target):
+            objects = len(gc.get_objects())
+            rss = current_rss()
+            if tracing:
+                traced = tracemalloc.get_traced_memory()[0]
+            try:
+                func(handler, source, target)
+            finally:
+                record.calls += 1
+                record.objects += len(gc.get_objects()) - objects
+                record.rss += current_rss() - rss
+                if tracing:
+                    record.traced += \
+                        tracemalloc.get_traced_memory()[0] - traced
+        return accounted
+
+    def end(self, name):
+        if name in self.boundaries:
+            previous = self.snapshots and self.snapshots[-1] or self.baseline
+            self.snapshots.append(MemorySnapshot(name, previous, self.limit))
+            if previous is not None:
+                previous._snapshot = None
+        super(MemoryAccounting, self).end(name)
+
+    def report(self):
+        """Text report of memory growth per phase and handler.
+        """
+        lines = list()
+        if not self.tracing:
+            lines.append('tracemalloc not tracing: no allocations by line, '
+                         'handler growth in tracked objects and RSS only. '
+                         'RSS does not shrink when memory is freed')
+        previous = self.baseline
+        for snapshot in self.snapshots:
+            lines.append('')
+            line = '%s: RSS %s (%s), peak RSS %s' % (
+                snapshot.phase, _kib(snapshot.rss * 1024, False),
+                _kib((snapshot.rss - (previous and previous.rss or 0))
+                     * 1024),
+                _kib(snapshot.peak_rss * 1024, False))
+            if snapshot.traced is not None:
+                line += ', traced %s, peak %s' % (
+                    _kib(snapshot.traced, False), _kib(snapshot.peak, False))
+            lines.append(line)
+            if snapshot.allocations:
+                lines.append('  allocations:')
+                for size, location in snapshot.allocations:
+                    lines.append('    %14s %s' % (_kib(size), location))
+            lines.append('  objects:')
+            for count, name in snapshot.growth(previous, self.limit):
+                lines.append('    %+14i %s' % (count, name))
+            previous = snapshot
+        if self.baseline is not None and self.snapshots:
+            last = self.snapshots[-1]
+            lines.append('')
+            lines.append('run: RSS %s, peak RSS %s' % (
+                _kib((last.rss - self.baseline.rss) * 1024),
+                _kib((last.peak_rss - self.baseline.peak_rss) * 1024)))
+        if self.handlers:
+            lines.append('')
+            lines.append('handlers:')
+            lines.append('    %14s %14s %14s %8s' % (
+                'traced', 'RSS', 'objects', 'calls'))
+            if self.tracing:
+                key = lambda record: record.traced
+            else:
+                key = lambda record: (record.rss, record.objects)
+            handlers = sorted(self.handlers.values(), key=key, reverse=True)
+            for record in handlers[:self.limit]:
+                traced = '-'
+                if record.traced is not None:
+                    traced = _kib(record.traced)
+                lines.append('    %14s %14s %+14i %8i %s' % (
+                    traced, _kib(record.rss * 1024), record.objects,
+                    record.calls, record.name))
+        return '\n'.join(lines).strip()
+
+    def write(self, path):
+        with open(path, 'w') as file:
+            file.write(self.report() + '\n')
+
+
+def memory_report_path():
+    """Memory is accounted if ``AGX_DEXTERITY_MEMORY_REPORT`` is set to the
+    path the report is written to when a run finishes.
+    """
+    return os.environ.get('AGX_DEXTERITY_MEMORY_REPORT')
+
+
+_accounting = None
+
+
+def account_memory():
+    """Account memory of the dexterity generator if enabled.
+
+    Starts ``tracemalloc`` if available and not tracing yet.
+    """
+    global _accounting
+    path = memory_report_path()
+    if not path or _accounting is not None:
+        return
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _accounting = MemoryAccounting(path=os.path.abspath(path))
+    add_observer(_accounting)
@@ -0,0 +1,11 @@
+from node.ext.uml.interfaces import IClass
+
+
+class IDexterityType(IClass):
+    """Marker.
+    """
+
+
+class IDexterityBehavior(IClass):
+    """Marker.
+    """
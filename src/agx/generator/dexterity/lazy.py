@@ -0,0 +1,50 @@
+import posixpath
+from agx.core import handler
+from agx.generator.uml.configure import registerXMLScope
+
+
+PROFILE = 'dexterity.profile.uml'
+
+
+def load():
+    """Import generator modules, which register scopes and handlers.
+    """
+    import agx.generator.dexterity.scope
+    import agx.generator.dexterity.gsgenerator
+    import agx.generator.dexterity.dxgenerator
+    from agx.generator.dexterity.instrumentation import (
+        profile_handlers,
+        account_memory,
+    )
+    profile_handlers()
+    account_memory()
+
+
+def applies_dexterity(source):
+    """Check whether XMI ``profileApplication`` node applies the dexterity
+    profile.
+    """
+    for child in source.values():
+        href = child.attributes.get('href')
+        if not href or not child.__name__.endswith('appliedProfile'):
+            continue
+        if posixpath.basename(href.split('#')[0]) == PROFILE:
+            return True
+    return False
+
+
+registerXMLScope('profileapplication', 'xmi2uml', ['profileApplication'])
+
+
+@handler('dxload', 'xmi2uml', 'profilegenerator', 'profileapplication')
+def dxload(self, source, target):
+    """Load the generator as soon as the model applies the dexterity
+    profile.
+
+    Profiles are passed to every run, thus the profile itself showing up
+    tells nothing. ``profilegenerator`` is the first generator of the first
+    transform, so all scopes and handlers are registered before they get
+    dispatched. Once loaded they stay registered for the process.
+    """
+    if applies_dexterity(source):
+        load()
@@ -0,0 +1,72 @@
+import os
+from contextlib import contextmanager
+
+
+class Options(object):
+    """Options of a generator run.
+
+    Options not given are read from environment variables, thus they apply
+    to runs of the ``agx`` command too.
+    """
+
+    def __init__(self, only=None, zcml=None, incremental=None, blobs=None,
+                 shared_icons=None):
+        """@param only: names of content types and behaviors to generate,
+            defaults to comma separated ``AGX_DEXTERITY_ONLY``
+        @param zcml: flag whether to register in ZCML instead of grokking,
+            defaults to ``AGX_DEXTERITY_ZCML``
+        @param incremental: flag whether to generate changed types only,
+            defaults to ``AGX_DEXTERITY_INCREMENTAL``
+        @param blobs: flag whether binary fields are stored in blobs,
+            defaults to ``AGX_DEXTERITY_BLOBS``, which is true if not set
+        @param shared_icons: flag whether all types share one icon per
+            container and item, defaults to ``AGX_DEXTERITY_SHARED_ICONS``
+        """
+        if only is None:
+            only = os.environ.get('AGX_DEXTERITY_ONLY', '').split(',')
+        self.only = frozenset([name.strip() for name in only if name.strip()])
+        if zcml is None:
+            zcml = bool(os.environ.get('AGX_DEXTERITY_ZCML'))
+        self.zcml = zcml
+        if incremental is None:
+            incremental = bool(os.environ.get('AGX_DEXTERITY_INCREMENTAL'))
+        self.incremental = incremental
+        if blobs is None:
+            blobs = os.environ.get('AGX_DEXTERITY_BLOBS', '1') \
+                not in ['False', 'false', 'FALSE', '0']
+        self.blobs = blobs
+        if shared_icons is None:
+            shared_icons = bool(os.environ.get('AGX_DEXTERITY_SHARED_ICONS'))
+        self.shared_icons = shared_icons
+
+
+# options of the generator run in progress, set by ``applied``
+_current = None
+
+
+def current():
+    """Return options of the generator run in progress.
+
+    Runs not started through ``applied``, i.e. by ``agx.core.Controller``,
+    read options from the environment.
+    """
+    if _current is None:
+        return Options()
+    return _current
+
+
+@contextmanager
+def applied(options):
+    """Apply options to generator runs within the block.
+
+    @param options: ``Options`` or None to keep the options in effect, which
+        are read from the environment outside of any block
+    """
+    global _current
+    previous = _current
+    if options is not None:
+        _current = options
+    try:
+        yield options
+    finally:
+        _current = previous
@@ -0,0 +1,180 @@
+import os
+import hashlib
+import logging
+import zope.component.event # hook up component registration events
+from lxml import etree
+from zope.interface import (
+    implementer,
+    alsoProvides,
+)
+from zope.component import provideUtility
+from zope.component.interfaces import IUtilityRegistration
+from node.ext.xml.interfaces import IXMLFactory
+from node.interfaces import IRoot
+from node.ext.xml._api import (
+    XMLFactory,
+    XMLNode,
+)
+
+
+log = logging.getLogger('agx.generator.dexterity')
+
+
+# bump if ``compact`` changes, invalidates all existing snapshots
+SNAPSHOT_VERSION = '1'
+
+# eAnnotations with this source contain the ecore definition of a profile.
+# They are written by Papyrus and not needed for code generation.
+ECORE_DEFINITION = 'http://www.eclipse.org/uml2/2.0.0/UML'
+
+
+def cachedir():
+    """Directory where profile snapshots are stored.
+
+    Can be set by ``AGX_PROFILE_CACHE`` environment variable.
+    """
+    default = os.path.join(os.path.expanduser('~'), '.agx', 'profilecache')
+    return os.environ.get('AGX_PROFILE_CACHE', default)
+
+
+def is_profile(path):
+    return path.endswith('.profile.uml')
+
+
+def compact(data):
+    """Strip ecore definitions from UML profile XMI data.
+    """
+    root = etree.fromstring(data)
+    for child in root.iterchildren('eAnnotations'):
+        if child.get('source') == ECORE_DEFINITION:
+            root.remove(child)
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+
+def snapshot(path, directory=None):
+    """Return path of the compact snapshot of UML profile at path.
+
+    Snapshots are keyed by the profile's path and content hash, thus a
+    snapshot gets rebuilt automatically when the profile changes. Outdated
+    snapshots are not removed, concurrent runs might still read them.
+    """
+    if directory is None:
+        directory = cachedir()
+    with open(path, 'rb') as file:
+        data = file.read()
+    digest = hashlib.sha1(SNAPSHOT_VERSION + data).hexdigest()
+    location = hashlib.sha1(os.path.abspath(path)).hexdigest()[:12]
+    prefix = os.path.basename(path)[:-len('.uml')]
+    snapshot = os.path.join(directory,
+                            '%s-%s-%s.uml' % (prefix, location, digest))
+    if os.path.exists(snapshot):
+        return snapshot
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # created by a concurrent run
+            if not os.path.isdir(directory):
+                raise
+    # write to a temporary file first, concurrent runs might read snapshot
+    tmp = '%s.%i.tmp' % (snapshot, os.getpid())
+    with open(tmp, 'wb') as file:
+        file.write(compact(data))
+    os.rename(tmp, snapshot)
+    return snapshot
+
+
+@implementer(IXMLFactory)
+class SnapshotXMLFactory(object):
+    """XML factory reading UML profiles from their compact snapshot.
+
+    Wraps the XML factory which actually parses the files.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __call__(self, path, idattribute='id', buffer=None):
+        if buffer is not None or not is_profile(path):
+            return self.factory(path, idattribute, buffer)
+        try:
+            xml = self.factory(snapshot(path), idattribute)
+        except (IOError, OSError, etree.LxmlError) as e:
+            # snapshot not writable, or truncated or removed concurrently
+            log.warning("Cannot use profile snapshot for '%s': %s" % (path, e))
+            return self.factory(path, idattribute, buffer)
+        xml.outpath = path
+        return xml
+
+
+def snapshot_xml_factory():
+    return SnapshotXMLFactory(XMLFactory())
+
+
+def references(xml, idattribute):
+    """Return dict of nodes of XML tree by id.
+    """
+    ret = dict()
+    def walk(node):
+        for child in node.values():
+            id = child.attributes.get(idattribute)
+            if id:
+                ret[id] = child
+            walk(child)
+    walk(xml)
+    return ret
+
+
+@implementer(IXMLFactory)
+class ProfileTreeCache(object):
+    """XML factory keeping parsed UML profile trees for reuse by subsequent
+    models generated in the same process.
+
+    Profile trees are not modified by the transforms, thus the same tree can
+    be read again once the process global XML reference index got reset.
+    Trees are parsed again if the profile file changed.
+
+    Rebinding the node index of a tree and filling the reference index rely
+    on ``_index`` of ``node`` and ``XMLNode.refindex`` of ``node.ext.xml``,
+    neither has a public API. ``node.ext.xml`` is pinned.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        # (path, idattribute) -> (mtime, tree, node index, references)
+        self.trees = dict()
+
+    def __call__(self, path, idattribute='id', buffer=None):
+        if buffer is not None or not is_profile(path):
+            return self.factory(path, idattribute, buffer)
+        mtime = os.path.getmtime(path)
+        key = (path, idattribute)
+        cached = self.trees.get(key)
+        if cached is None or cached[0] != mtime:
+            xml = self.factory(path, idattribute)
+            cached = self.trees[key] = (mtime, xml, xml._index,
+                                        references(xml, idattribute))
+        mtime, xml, index, refs = cached
+        # the XMI node reading the tree rebinds its node index and removes
+        # the root marker
+        xml._index = index
+        alsoProvides(xml, IRoot)
+        XMLNode.refindex.update(refs)
+        return xml
+
+
+def xml_factory_registered(event):
+    """Wrap XML factories registered after the snapshot factory.
+
+    Generator configurations are loaded in no specific order, thus another
+    generator might register the plain XML factory after ours.
+    """
+    registration = event.object
+    if not IUtilityRegistration.providedBy(registration) \
+      or registration.provided is not IXMLFactory \
+      or registration.name \
+      or isinstance(registration.component,
+                    (SnapshotXMLFactory, ProfileTreeCache)):
+        return
+    provideUtility(SnapshotXMLFactory(registration.component),
+                   provides=IXMLFactory)
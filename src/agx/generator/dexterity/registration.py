@@ -0,0 +1,197 @@
+import os
+from node.ext.zcml import (
+    ZCMLFile,
+    SimpleDirective,
+    ComplexDirective,
+)
+from agx.generator.zca.utils import (
+    addZcmlRef,
+    get_zcml,
+    set_zcml_directive,
+)
+from agx.generator.dexterity.options import current
+from agx.generator.dexterity import utils
+
+
+# namespaces of configure.zcml files written by dexterity generator
+GROK_NSMAP = {
+    None: 'http://namespaces.zope.org/zope',
+    'plone': 'http://namespaces.plone.org/plone',
+    'grok': 'http://namespaces.zope.org/grok',
+}
+
+ZCML_NSMAP = {
+    None: 'http://namespaces.zope.org/zope',
+    'plone': 'http://namespaces.plone.org/plone',
+}
+
+
+# imports of generated modules by registration mode
+GROK_IMPORTS = [
+    ('five', 'grok'),
+    ('plone.directives', 'dexterity'),
+    ('plone.directives', 'form'),
+    ('grokcore.view.components', 'PageTemplate'),
+]
+
+ZCML_IMPORTS = [
+    ('plone.dexterity.browser.view', 'DefaultView'),
+    ('plone.dexterity.content', 'Item'),
+    ('plone.dexterity.content', 'Container'),
+    ('plone.supermodel', 'model'),
+    ('plone.autoform.interfaces', 'IFormFieldProvider'),
+]
+
+
+def enabled():
+    """Views, indexers and content classes are registered in ZCML instead
+    of being grokked if ``zcml`` option of the run is set.
+
+    Packages generated this way are not scanned by martian on startup.
+    """
+    return current().zcml
+
+
+def nsmap():
+    if enabled():
+        return ZCML_NSMAP
+    return GROK_NSMAP
+
+
+def remove_imports(module):
+    """Remove imports of the other mode from python module.
+
+    Imports still used by custom code of the module are kept.
+    """
+    if enabled():
+        utils.remove_imports(module, GROK_IMPORTS)
+    else:
+        utils.remove_imports(module, ZCML_IMPORTS)
+
+
+def normalize(zcml):
+    """Drop whitespace between elements of ZCML file read from file system.
+
+    Otherwise directives added to it are not indented when written and the
+    ZCML formatter breaks the file.
+    """
+    for element in zcml.model.element.iter():
+        if element.text is not None and not element.text.strip():
+            element.text = None
+        if element.tail is not None and not element.tail.strip():
+            element.tail = None
+    return zcml
+
+
+def configure_zcml(directory):
+    """Return ``configure.zcml`` of directory, created if missing.
+
+    In ZCML mode a ``grok:grok`` directive left from a previous run is
+    removed, otherwise it is added.
+    """
+    zcml = normalize(get_zcml(directory, 'configure.zcml',
+                              nsmap=dict(nsmap())))
+    if not enabled():
+        zcml.nsmap['grok'] = GROK_NSMAP['grok']
+        set_zcml_directive(directory, 'configure.zcml',
+                           'grok:grok', 'package', '.')
+        return zcml
+    if 'grok' in zcml.nsmap:
+        for directive in zcml.filter(tag='grok:grok', attr='package',
+                                     value='.'):
+            del zcml[directive.__name__]
+    return zcml
+
+
+def browser_zcml(directory):
+    """Return ``browser.zcml`` of directory, created and included in
+    ``configure.zcml`` if missing.
+    """
+    if 'browser.zcml' in directory:
+        zcml = normalize(directory['browser.zcml'])
+    else:
+        path = directory.path
+        path.append('browser.zcml')
+        zcml = ZCMLFile(os.path.join(*path))
+        zcml.nsmap['browser'] = 'http://namespaces.zope.org/browser'
+        directory['browser.zcml'] = zcml
+    addZcmlRef(directory, zcml)
+    return zcml
+
+
+def set_page(directory, for_, name, class_, template, permission):
+    """Register browser page in ``browser.zcml`` of directory.
+    """
+    zcml = browser_zcml(directory)
+    pages = zcml.filter(tag='browser:page', attr='class', value=class_)
+    if pages:
+        page = pages[0]
+    else:
+        page = SimpleDirective(name='browser:page', parent=zcml)
+    page.attrs['for'] = for_
+    page.attrs['name'] = name
+    page.attrs['class'] = class_
+    page.attrs['template'] = template
+    page.attrs['permission'] = permission
+    return page
+
+
+def set_adapter(directory, factory, name):
+    """Register named adapter factory in ``configure.zcml`` of directory.
+
+    Adapted and provided interfaces are declared by the factory.
+    """
+    zcml = configure_zcml(directory)
+    adapters = zcml.filter(tag='adapter', attr='factory', value=factory)
+    if adapters:
+        adapter = adapters[0]
+    else:
+        adapter = SimpleDirective(name='adapter', parent=zcml)
+    adapter.attrs['factory'] = factory
+    adapter.attrs['name'] = name
+    return adapter
+
+
+def set_class(directory, class_, interface, permission):
+    """Declare security of class in ``configure.zcml`` of directory.
+
+    Attributes of interface are protected by permission.
+    """
+    zcml = configure_zcml(directory)
+    classes = zcml.filter(tag='class', attr='class', value=class_)
+    if classes:
+        return classes[0]
+    directive = ComplexDirective(name='class', parent=zcml)
+    directive.attrs['class'] = class_
+    require = SimpleDirective(name='require', parent=directive)
+    require.attrs['permission'] = permission
+    require.attrs['interface'] = interface
+    return directive
+
+
+def remove_directives(directory, name, tag, attr, value):
+    """Remove directives of ZCML file ``name`` in directory matching
+    ``attr`` with ``value``.
+
+    Used to drop registrations written in the other mode by a previous run.
+    """
+    if name not in directory:
+        return
+    zcml = directory[name]
+    if tag.find(':') != -1 and tag.split(':')[0] not in zcml.nsmap:
+        return
+    directives = zcml.filter(tag=tag, attr=attr, value=value)
+    if not directives:
+        return
+    normalize(zcml)
+    for directive in directives:
+        del zcml[directive.__name__]
+
+
+def set_attr(directive, name, value):
+    """Set attribute of directive, remove it if value is None.
+    """
+    if value is not None:
+        directive.attrs[name] = value
+    elif name in directive.attrs:
+        del directive.model.attributes[name]
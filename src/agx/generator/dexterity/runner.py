@@ -0,0 +1,218 @@
+import os
+import sys
+import logging
+import multiprocessing
+from optparse import OptionParser
+import agx.core
+from zope.configuration.xmlconfig import XMLConfig
+from agx.generator.dexterity.options import (
+    Options,
+    applied,
+)
+
+
+log = logging.getLogger('agx.generator.dexterity')
+
+
+_configured = False
+
+
+def configure():
+    """Load AGX configuration, done once per process.
+    """
+    global _configured
+    if _configured:
+        return
+    import agx.core.loader
+    XMLConfig('configure.zcml', agx.core)()
+    _configured = True
+
+
+def generate(modelpaths, outdir, options=None):
+    """Run AGX on model and profiles at modelpaths, write to outdir.
+
+    @param options: ``options.Options`` of the run
+    """
+    configure()
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    with applied(options):
+        agx.core.Controller()(modelpaths, outdir)
+    return outdir
+
+
+# batch of pool worker process
+_batch = None
+
+
+def _init_worker():
+    global _batch
+    from agx.generator.dexterity.batch import Batch
+    configure()
+    _batch = Batch().open()
+
+
+def _generate_job(job):
+    return _batch.generate(*job)
+
+
+def generate_batch(jobs, options=None, processes=1):
+    """Generate several models, one after another or in a process pool.
+
+    Configuration and parsed profiles are loaded once per process, generator
+    state is reset between models. AGX transforms process a model as a whole
+    and keep state in process global tokens, thus with several processes
+    each one generates whole models.
+
+    @param jobs: list of ``(modelpaths, outdir)`` tuples
+    @param options: ``options.Options`` of all runs
+    @param processes: number of worker processes, None for CPU count. 1
+        generates in this process
+    @return: list of output directories in order of jobs
+    """
+    outdirs = [os.path.abspath(outdir) for modelpaths, outdir in jobs]
+    if len(set(outdirs)) != len(outdirs):
+        raise ValueError(u"Output directories of jobs must be distinct.")
+    if processes == 1 or len(jobs) < 2:
+        from agx.generator.dexterity.batch import Batch
+        configure()
+        with Batch() as batch:
+            return [batch.generate(modelpaths, outdir, options)
+                    for modelpaths, outdir in jobs]
+    pool = multiprocessing.Pool(processes, initializer=_init_worker)
+    try:
+        return pool.map(_generate_job,
+                        [(modelpaths, outdir, options)
+                         for modelpaths, outdir in jobs], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def check_jobs(jobs, unified=False, options=None):
+    """Generate jobs in memory and print reports.
+
+    @return: 1 if any file would be written, otherwise 0
+    """
+    from agx.generator.dexterity import dryrun
+    from agx.generator.dexterity.batch import Batch
+    configure()
+    status = 0
+    with Batch() as batch:
+        for modelpaths, outdir in jobs:
+            diffs = dryrun.dryrun(modelpaths, outdir, options=options,
+                                  batch=batch)
+            if [diff for diff in diffs if diff.state != dryrun.UNCHANGED]:
+                status = 1
+            report = dryrun.report(diffs, unified)
+            if report:
+                print report
+    return status
+
+
+def watch(jobs, interval=None, options=None):
+    """Regenerate jobs on changes until interrupted.
+    """
+    from agx.generator.dexterity.watch import (
+        Watcher,
+        INTERVAL,
+    )
+    configure()
+    log.info("Watching %i model(s), press Ctrl+C to stop" % len(jobs))
+    try:
+        Watcher(jobs, interval or INTERVAL, options=options)()
+    except KeyboardInterrupt:
+        pass
+
+
+def model_job(modelpath, outdir=None):
+    """Create job for model at modelpath like ``agx`` command does.
+
+    Profiles are read from the model's ``.agx`` file.
+    """
+    configure()
+    from agx.core.main import (
+        prepare_model_path,
+        read_config,
+        unify_profile_paths,
+    )
+    localdir, umlname, agxname = prepare_model_path(modelpath)
+    profiles = list()
+    if agxname:
+        profiles = read_config(localdir, agxname)[0]
+    modelpaths = [os.path.join(localdir, umlname)]
+    modelpaths += unify_profile_paths(localdir, profiles)
+    return modelpaths, outdir or localdir
+
+
+def read_jobs(path):
+    """Read jobs from file at path.
+
+    Each line contains a model path, optionally followed by the output
+    directory, separated by whitespace. Relative paths are relative to the
+    file. Empty lines and lines starting with ``#`` are ignored.
+    """
+    basedir = os.path.dirname(os.path.abspath(path))
+    jobs = list()
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            paths = [os.path.join(basedir, os.path.expanduser(part))
+                     for part in line.split(None, 1)]
+            jobs.append(model_job(*paths))
+    return jobs
+
+
+parser = OptionParser("Usage: agx-dexterity [options] UMLFILE [UMLFILE ...]")
+parser.add_option("-j", "--jobs", dest="jobs", type="int", default=None,
+                  help="Number of worker processes generating whole models in "
+                  "parallel, defaults to CPU count")
+parser.add_option("-f", "--file", dest="file", default=None,
+                  help="Read models from file, one per line, optionally "
+                  "followed by the output directory")
+parser.add_option("-n", "--dry-run", dest="dryrun", action="store_true",
+                  default=False, help="Generate in memory without writing and "
+                  "report which files would be new, "
+                  "changed or removed. Exit with status 1 if any")
+parser.add_option("--diff", dest="diff", action="store_true", default=False,
+                  help="Include unified diffs of changed files in dry run "
+                  "report")
+parser.add_option("-w", "--watch", dest="watch", action="store_true",
+                  default=False, help="Keep running and regenerate models "
+                  "as soon as model or profile files are saved")
+parser.add_option("--interval", dest="interval", type="float", default=None,
+                  help="Seconds between checks for changed files in watch "
+                  "mode")
+parser.add_option("--only", dest="only", action="append", default=None,
+                  help="Generate only named content type or behavior and "
+                  "its dependencies, by class name or type id. May be given "
+                  "multiple times")
+parser.add_option("--zcml", dest="zcml", action="store_true", default=False,
+                  help="Register views, indexers and content classes in ZCML "
+                  "instead of grokking the generated package")
+
+
+def main(argv=None):
+    """Generate several models, by default in a process per CPU.
+
+    Each model is generated into its containing directory unless another
+    one is given in the jobs file, profiles are read from the ``.agx`` file
+    of the model.
+    """
+    options, args = parser.parse_args(argv)
+    jobs = [model_job(path) for path in args]
+    if options.file:
+        jobs += read_jobs(options.file)
+    if not jobs:
+        parser.print_help()
+        sys.exit(2)
+    run_options = Options(only=options.only, zcml=options.zcml or None)
+    if options.dryrun:
+        sys.exit(check_jobs(jobs, options.diff, run_options))
+    if options.watch:
+        watch(jobs, options.interval, run_options)
+        return
+    for outdir in generate_batch(jobs, run_options, options.jobs):
+        log.info("Generated into: '%s'" % outdir)
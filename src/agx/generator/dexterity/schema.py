@@ -83,6 +83,29 @@ field_defaults = {
 }
 
 
+# Schema field properties read per field group. Order of properties defines
+# the order of keyword arguments of the generated field.
+#
+# key:
+#     field group as used in ``field_types``
+#
+# value:
+#     list of ``field_properties`` keys
+_field = ['title', 'description', 'required', 'readonly', 'default',
+          'missing_value']
+_minmaxlen = _field + ['min_length', 'max_length']
+field_group_properties = {
+    'collection': _minmaxlen + ['value_type', 'unique'],
+    'minmaxlen': _minmaxlen,
+    'dict': _minmaxlen + ['key_type', 'value_type'],
+    'field': _field,
+    'richtext': _field + ['default_mime_type', 'output_mime_type',
+                          'allowed_mime_types'],
+    'minmax': _field + ['min', 'max'],
+    'object': _field + ['schema'],
+}
+
+
 # Schema field types related to
 # http://plone.org/products/dexterity/documentation/manual/developer-manual/reference/fields
 #
@@ -192,8 +215,8 @@ field_types = {
             'depends': 'plone.namedfile',
         },
         'dexterity:NamedBlobImage': {
-            'factory': 'NamedBlobFile',
-            'import': 'NamedBlobFile',
+            'factory': 'NamedBlobImage',
+            'import': 'NamedBlobImage',
             'import_from': 'plone.namedfile.field',
             'depends': 'plone.namedfile',
         },
@@ -238,3 +261,24 @@ field_types = {
         },
     },
 }
+
+
+# Binary field types stored in blobs.
+#
+# Binary fields not stored in blobs are generated as their blob counterpart
+# unless disabled by the ``blob`` tagged value or for the whole generator run.
+#
+# key:
+#     stereotype name
+#
+# value:
+#     stereotype name of blob counterpart
+blob_field_types = {
+    'dexterity:NamedFile': 'dexterity:NamedBlobFile',
+    'dexterity:NamedImage': 'dexterity:NamedBlobImage',
+}
+
+
+# Stereotypes of binary fields. Their values are never stored as catalog
+# metadata.
+binary_field_types = set(blob_field_types.keys() + blob_field_types.values())
@@ -1,74 +1,43 @@
 from node.ext.uml.interfaces import IAssociation
+from agx.core.interfaces import ISource
 from agx.core import (
     Scope,
     registerScope,
 )
+from agx.generator.dexterity.utils import field_classification
 
 
-class CollectionScope(Scope):
-
-    def __call__(self, node):
-        return node.stereotype('dexterity:Tuple') \
-            or node.stereotype('dexterity:List') \
-            or node.stereotype('dexterity:Set') \
-            or node.stereotype('dexterity:Frozenset')
-    
-
-class MinMaxLenScope(Scope):
-
-    def __call__(self, node):
-        return node.stereotype('dexterity:SourceText') \
-            or node.stereotype('dexterity:Bytes') \
-            or node.stereotype('dexterity:ASCII') \
-            or node.stereotype('dexterity:DottedName') \
-            or node.stereotype('dexterity:BytesLine') \
-            or node.stereotype('dexterity:URI') \
-            or node.stereotype('dexterity:ASCIILine') \
-            or node.stereotype('dexterity:Id') \
-            or node.stereotype('dexterity:Text') \
-            or node.stereotype('dexterity:TextLine') \
-            or node.stereotype('dexterity:Password')
-
-
-class DictScope(Scope):
+class FieldScope(Scope):
+    """Base for field scopes, matches nodes classified to ``group``.
+    """
+    group = 'field'
 
     def __call__(self, node):
-        return node.stereotype('dexterity:Dict')
+        return self.group in field_classification(node)
 
 
-class FieldScope(Scope):
+class CollectionScope(FieldScope):
+    group = 'collection'
 
-    def __call__(self, node):
-        return node.stereotype('dexterity:Bool') \
-            or node.stereotype('dexterity:InterfaceField') \
-            or node.stereotype('dexterity:NamedFile') \
-            or node.stereotype('dexterity:Relation') \
-            or node.stereotype('dexterity:NamedImage') \
-            or node.stereotype('dexterity:NamedBlobFile') \
-            or node.stereotype('dexterity:NamedBlobImage')
 
+class MinMaxLenScope(FieldScope):
+    group = 'minmaxlen'
 
-class RichTextScope(Scope):
 
-    def __call__(self, node):
-        return node.stereotype('dexterity:RichText')
+class DictScope(FieldScope):
+    group = 'dict'
 
 
-class MinMaxScope(Scope):
+class RichTextScope(FieldScope):
+    group = 'richtext'
 
-    def __call__(self, node):
-        return node.stereotype('dexterity:Int') \
-            or node.stereotype('dexterity:Float') \
-            or node.stereotype('dexterity:Date') \
-            or node.stereotype('dexterity:Datetime') \
-            or node.stereotype('dexterity:Timedelta') \
-            or node.stereotype('dexterity:Decimal')
 
+class MinMaxScope(FieldScope):
+    group = 'minmax'
 
-class ObjectScope(Scope):
 
-    def __call__(self, node):
-        return node.stereotype('dexterity:Object')
+class ObjectScope(FieldScope):
+    group = 'object'
 
 
 class BehaviorScope(Scope):
@@ -77,6 +46,7 @@ class BehaviorScope(Scope):
         return node.stereotype('dexterity:behavior')
 
 
+registerScope('dxmodel', 'xmi2uml', [ISource], Scope)
 registerScope('association', 'uml2fs', [IAssociation], Scope)
 registerScope('dxcollection', 'uml2fs', None, CollectionScope)
 registerScope('dxminmaxlen', 'uml2fs', None, MinMaxLenScope)
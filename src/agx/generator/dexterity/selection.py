@@ -0,0 +1,148 @@
+import logging
+from node.ext.uml.interfaces import (
+    IClass,
+    IAssociation,
+    IDependency,
+)
+from agx.core.util import dotted_path
+from agx.generator.dexterity.utils import relations
+from agx.generator.dexterity.options import current
+
+
+log = logging.getLogger('agx.generator.dexterity')
+
+
+# stereotypes of classes subject to selective generation
+SELECTABLE = ('plone:content_type', 'dexterity:behavior',
+              'plone:dynamic_view')
+
+
+def selected():
+    """Names of content types and behaviors to generate, given by ``only``
+    option of the run as class names or type ids. Empty if the whole model
+    gets generated.
+    """
+    return current().only
+
+
+def enabled():
+    return bool(selected())
+
+
+def names(class_):
+    """Names a class can be selected by.
+
+    Class name, dotted path and type id. Behavior classes are renamed to
+    their interface name while reading the model, thus their model name is
+    accepted too.
+    """
+    ret = set([class_.name, dotted_path(class_),
+               '%s.%s' % (dotted_path(class_.parent), class_.name.lower())])
+    if class_.stereotype('dexterity:behavior'):
+        ret.add(class_.name[1:])
+    return ret
+
+
+def selectable(model):
+    """Classes of model subject to selective generation.
+    """
+    ret = list()
+    def walk(node):
+        for child in node.values():
+            if IClass.providedBy(child):
+                for stereotype in SELECTABLE:
+                    if child.stereotype(stereotype):
+                        ret.append(child)
+                        break
+            else:
+                walk(child)
+    walk(model)
+    return ret
+
+
+def closure(model, selection):
+    """Return dict of classes by uuid the classes named in selection depend
+    on, including themselves.
+    """
+    classes = list()
+    found = set()
+    for class_ in selectable(model):
+        matching = names(class_) & selection
+        if matching:
+            classes.append(class_)
+            found.update(matching)
+    for name in selection - found:
+        log.warning("Selected type '%s' not found in model" % name)
+    return dependencies(model, classes)
+
+
+def dependencies(model, classes):
+    """Return dict of classes by uuid the given classes depend on, including
+    themselves.
+
+    Content types depend on contained content types (``gscomposition``),
+    on their behaviors (``gsbehavior``) and on their dynamic views
+    (``gsdynamicview``).
+    """
+    relations_ = relations(model)
+    pending = list(classes)
+    ret = dict()
+    while pending:
+        class_ = pending.pop()
+        if class_.uuid in ret:
+            continue
+        ret[class_.uuid] = class_
+        if not class_.stereotype('plone:content_type'):
+            continue
+        for relation in relations_.get(class_.uuid, list()):
+            if IAssociation.providedBy(relation):
+                if relation.ownedEnds[0].type is not class_:
+                    continue
+                for member in relation.memberEnds:
+                    if member.type is not class_ \
+                      and member.type.stereotype('plone:content_type'):
+                        pending.append(member.type)
+            elif IDependency.providedBy(relation):
+                client = relation.client
+                if relation.supplier is class_ \
+                  and (client.stereotype('dexterity:behavior')
+                       or client.stereotype('plone:dynamic_view')):
+                    pending.append(client)
+    return ret
+
+
+def prune(model, keep):
+    """Remove selectable classes of model not in keep, along with their
+    associations and dependencies.
+
+    Done while the model is read, the UML model is not modified by uml2fs
+    generators. Output of removed classes is left untouched.
+
+    @param keep: dict of classes to keep by uuid
+    """
+    relations_ = relations(model)
+    removed = dict()
+    for class_ in selectable(model):
+        if class_.uuid in keep:
+            continue
+        removed[class_.uuid] = class_
+        for relation in relations_.get(class_.uuid, list()):
+            removed[relation.uuid] = relation
+    if not removed:
+        return
+    for node in removed.values():
+        parent = node.parent
+        if parent is not None and parent.get(node.__name__) is node:
+            del parent[node.__name__]
+    model.__dict__['_agx_dexterity_restricted'] = True
+    # relations changed
+    del model.__dict__['_agx_dexterity_relations']
+
+
+def restricted(model):
+    """Check whether classes were removed from model by ``prune``.
+
+    Files listing all types, like ``types.xml``, keep the entries of types
+    not generated then.
+    """
+    return bool(model.__dict__.get('_agx_dexterity_restricted'))
@@ -1 +1,186 @@
-#
\ No newline at end of file
+import os
+import shutil
+import tempfile
+import unittest
+import pkg_resources
+from agx.generator.dexterity import dryrun
+
+
+# files of generated eggs compared with golden output by default
+GOLDEN_PATTERNS = ('*',)
+
+# profiles models are generated with, as ``(package, profile name)``
+PROFILES = [
+    ('agx.generator.pyegg', 'pyegg'),
+    ('agx.generator.zca', 'zca'),
+    ('agx.generator.plone', 'plone'),
+    ('agx.generator.dexterity', 'dexterity'),
+    ('agx.generator.buildout', 'buildout'),
+]
+
+
+def profile_paths():
+    """Paths of the profiles models are generated with.
+    """
+    return [pkg_resources.resource_filename(
+        package, 'profiles/%s.profile.uml' % name)
+        for package, name in PROFILES]
+
+
+class GeneratorLayer(object):
+    """Test layer loading AGX configuration and parsing profiles once per
+    test session.
+
+    Usable as ``zope.testrunner`` layer. Test runners not aware of layers
+    call ``setUp`` in each test setup, which loads once, and ``tearDown`` in
+    the teardown of the test which set it up.
+
+    Profile snapshots are written to a temporary ``AGX_PROFILE_CACHE``
+    instead of the user's cache directory. ``tearDown`` removes it, restores
+    the environment and the XML factory replaced by the profile tree cache.
+    """
+    __bases__ = ()
+    __name__ = 'GeneratorLayer'
+    __module__ = 'agx.generator.dexterity.testing'
+
+    def __init__(self):
+        self.batch = None
+        self.profiles = None
+        self.environ = None
+        self.cachedir = None
+
+    def setUp(self):
+        if self.batch is not None:
+            return False
+        from agx.generator.dexterity.runner import configure
+        from agx.generator.dexterity.batch import Batch
+        self.environ = os.environ.get('AGX_PROFILE_CACHE')
+        self.cachedir = tempfile.mkdtemp(prefix='agx-dexterity-profiles-')
+        os.environ['AGX_PROFILE_CACHE'] = self.cachedir
+        configure()
+        self.profiles = profile_paths()
+        self.batch = Batch().open()
+        return True
+
+    def tearDown(self):
+        if self.batch is None:
+            return
+        self.batch.close()
+        self.batch = None
+        if self.environ is None:
+            os.environ.pop('AGX_PROFILE_CACHE', None)
+        else:
+            os.environ['AGX_PROFILE_CACHE'] = self.environ
+        self.environ = None
+        shutil.rmtree(self.cachedir, True)
+        self.cachedir = None
+
+    def modelpaths(self, modelpath):
+        """Return model path followed by the profile paths.
+        """
+        return [modelpath] + self.profiles
+
+    def controller(self):
+        return Controller(self)
+
+    def write_golden(self, modelpath, golden):
+        """Generate model into golden output directory, replacing existing
+        golden output.
+        """
+        shutil.rmtree(golden, True)
+        self.controller()(modelpath, golden)
+
+    def compare_golden(self, modelpath, golden, patterns=GOLDEN_PATTERNS):
+        """Generate model into an empty temporary directory and compare with
+        golden output directory.
+
+        @return: list of ``dryrun.FileDiff`` of files differing. ``new``
+            files are not contained in golden output, ``removed`` files are
+            not generated any more
+        """
+        tempdir = tempfile.mkdtemp(prefix='agx-dexterity-golden-')
+        try:
+            outdir = os.path.join(tempdir, os.path.basename(golden))
+            self.controller()(modelpath, outdir)
+            diffs = dryrun.compare(outdir, golden, patterns)
+        finally:
+            shutil.rmtree(tempdir)
+        return [diff for diff in diffs if diff.state != dryrun.UNCHANGED]
+
+
+LAYER = GeneratorLayer()
+
+
+class Controller(object):
+    """Controller generating with configuration and profiles of a layer.
+
+    Like ``agx.core.Controller``, but models might be passed as single path
+    the layer adds the profiles to. Tokens are reset before each run.
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+
+    def transform(self, sourcepath, targetpath):
+        """Run transforms without writing the target tree.
+        """
+        if isinstance(sourcepath, basestring):
+            sourcepath = self.layer.modelpaths(sourcepath)
+        return self.layer.batch.transform(sourcepath, targetpath)
+
+    def __call__(self, sourcepath, targetpath):
+        target = self.transform(sourcepath, targetpath)
+        target()
+        return target
+
+
+def update_golden():
+    """Golden output is written instead of compared if
+    ``AGX_DEXTERITY_UPDATE_GOLDEN`` is set.
+    """
+    return bool(os.environ.get('AGX_DEXTERITY_UPDATE_GOLDEN'))
+
+
+class GoldenTestCase(unittest.TestCase):
+    """Compare output of a model with its golden output.
+    """
+
+    def __init__(self, layer, modelpath, golden, patterns=GOLDEN_PATTERNS):
+        super(GoldenTestCase, self).__init__()
+        self.layer = layer
+        self.modelpath = modelpath
+        self.golden = golden
+        self.patterns = patterns
+
+    def __str__(self):
+        return 'golden output of %s' % os.path.basename(self.modelpath)
+
+    def setUp(self):
+        self.layer.setUp()
+
+    def runTest(self):
+        if update_golden() or not os.path.exists(self.golden):
+            self.layer.write_golden(self.modelpath, self.golden)
+            return
+        diffs = self.layer.compare_golden(self.modelpath, self.golden,
+                                          self.patterns)
+        if diffs:
+            self.fail('%s\n%s' % (self, dryrun.report(diffs, unified=True)))
+
+
+def golden_suite(directory, layer=LAYER, patterns=GOLDEN_PATTERNS):
+    """Test suite comparing output of each model in directory with its
+    golden output.
+
+    Golden output of ``NAME.uml`` is expected in ``NAME.golden``. It is
+    written if missing.
+    """
+    suite = unittest.TestSuite()
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.uml') or name.endswith('.profile.uml'):
+            continue
+        modelpath = os.path.join(directory, name)
+        golden = os.path.join(directory, '%s.golden' % name[:-len('.uml')])
+        suite.addTest(GoldenTestCase(layer, modelpath, golden, patterns))
+    suite.layer = layer
+    return suite
@@ -11,25 +11,45 @@ optionflags = doctest.NORMALIZE_WHITESPACE | \
               doctest.REPORT_ONLY_FIRST_FAILURE
 
 
-TESTFILES = [
+# test files run in generator layer
+LAYERFILES = [
     'generator.rst',
+    'golden.rst',
 ]
 
 
 datadir = os.path.join(os.path.dirname(__file__), 'testing', 'data')
 
 
+def layer_setup(test):
+    from agx.generator.dexterity.testing import LAYER
+    # set up here if not done by a test runner aware of layers
+    test.globs['_layersetup'] = LAYER.setUp()
+    test.globs['layer'] = LAYER
+
+
+def layer_teardown(test):
+    if test.globs['_layersetup']:
+        test.globs['layer'].tearDown()
+
+
 def test_suite():
     import agx.core.loader
-    return unittest.TestSuite([
-        doctest.DocFileSuite(
-            file, 
+    from agx.generator.dexterity.testing import LAYER
+    suites = list()
+    for file in LAYERFILES:
+        suite = doctest.DocFileSuite(
+            file,
             optionflags=optionflags,
             globs={'interact': interact,
                    'pprint': pprint,
                    'datadir': datadir},
-        ) for file in TESTFILES
-    ])
+            setUp=layer_setup,
+            tearDown=layer_teardown,
+        )
+        suite.layer = LAYER
+        suites.append(suite)
+    return unittest.TestSuite(suites)
 
 
 if __name__ == '__main__':
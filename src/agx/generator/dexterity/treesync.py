@@ -0,0 +1,13 @@
+from agx.generator.pyegg.treesync import ModuleNameChooser
+
+
+class DexterityModuleNameChooser(ModuleNameChooser):
+
+    def __call__(self):
+        return self.context.name.lower()
+
+
+class DexterityBehaviorModuleNameChooser(ModuleNameChooser):
+
+    def __call__(self):
+        return self.context.name[1:].lower()
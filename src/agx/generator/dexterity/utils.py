@@ -1,12 +1,339 @@
+import re
+import uuid
+from node.ext import python
+from node.ext.python.interfaces import (
+    IBlock,
+    IProtectedSection,
+    IClass,
+    IDecorator,
+    IAttribute,
+    ICallableArguments,
+)
+from node.ext.uml.interfaces import (
+    IAssociation,
+    IDependency,
+)
 from agx.core.util import read_target_node
 from agx.generator.pyegg.utils import class_base_name
+from agx.generator.pyegg.utils import egg_source as lookup_egg_source
+from agx.generator.dexterity.schema import field_types
+
+
+# Lookups from source to target nodes are memoized on the source node. Source
+# nodes are created once per run, memoized target nodes are validated against
+# the target tree on each hit, thus nodes which were detached or renamed in
+# the meantime are looked up again.
+
+
+def memo(source):
+    """Return dict for memoizing lookups of source node.
+    """
+    try:
+        return source.__dict__['_agx_dexterity_memo']
+    except KeyError:
+        return source.__dict__.setdefault('_agx_dexterity_memo', dict())
+
+
+def attached(node, target):
+    """Check whether node is contained in the tree of target.
+    """
+    return node is not None and target.node(node.uuid) is node
+
+
+def target_node(source, target):
+    """Memoized ``agx.core.util.read_target_node``.
+    """
+    values = memo(source)
+    node = values.get('target')
+    if not attached(node, target):
+        node = values['target'] = read_target_node(source, target)
+    return node
+
+
+def egg_source(source):
+    """Memoized ``agx.generator.pyegg.utils.egg_source``.
+
+    The source model is not modified by uml2fs generators, no validation
+    needed.
+    """
+    values = memo(source)
+    egg = values.get('egg')
+    if egg is None:
+        egg = values['egg'] = lookup_egg_source(source)
+    return egg
+
+
+def relations(model):
+    """Return dict containing associations and dependencies per related
+    element uuid.
+
+    Computed once per model.
+    """
+    relations = model.__dict__.get('_agx_dexterity_relations')
+    if relations is not None:
+        return relations
+    relations = model.__dict__['_agx_dexterity_relations'] = dict()
+    def walk(node):
+        for child in node.values():
+            if IAssociation.providedBy(child):
+                ends = [end.type for end in child.memberEnds]
+            elif IDependency.providedBy(child):
+                ends = [child.client, child.supplier]
+            else:
+                walk(child)
+                continue
+            for end in ends:
+                if end is not None:
+                    relations.setdefault(end.uuid, list()).append(child)
+    walk(model)
+    return relations
 
 
 def type_id(source, target):
-    # calculate type id
-    class_ = read_target_node(source, target)
+    """Calculate type id of content type.
+    """
+    class_ = target_node(source, target)
+    values = memo(source)
+    cached = values.get('type_id')
+    if cached is not None \
+      and cached[0] is class_ \
+      and cached[1] is class_.parent \
+      and cached[2] == class_.classname:
+        return cached[3]
     if source.parent.stereotype('pyegg:pymodule'):
         name = '%s.%s' % (class_base_name(class_), class_.classname.lower())
     else:
         name = class_base_name(class_)
+    values['type_id'] = (class_, class_.parent, class_.classname, name)
     return name
+
+
+def schema_class(source, target):
+    """Return schema class of content type or None if not created yet.
+    """
+    klass = target_node(source, target)
+    module = klass.parent
+    name = 'I' + klass.classname
+    values = memo(source)
+    schema = values.get('schemaclass')
+    if attached(schema, target) \
+      and schema.parent is module \
+      and schema.classname == name:
+        return schema
+    found = module.classes(name)
+    schema = values['schemaclass'] = found and found[0] or None
+    return schema
+
+
+def compile_field_index(field_types):
+    """Compile ``field_types`` to a lookup table.
+
+    key:
+        stereotype name
+
+    value:
+        2-tuple containing field group and normalized field definition
+    """
+    index = dict()
+    for group, fields in field_types.items():
+        for stereotype, field in fields.items():
+            index[stereotype] = (group, {
+                'factory': field['factory'],
+                'import': field.get('import', 'schema'),
+                'import_from': field.get('import_from', 'zope'),
+                'depends': field.get('depends'),
+                'stereotype': stereotype,
+            })
+    return index
+
+
+field_index = compile_field_index(field_types)
+
+
+def field_classification(node):
+    """Return dict mapping field group to field definition for node.
+
+    The stereotypes of node are walked only once, the result gets cached on
+    the node itself.
+    """
+    try:
+        return node.__dict__['_agx_dexterity_fields']
+    except KeyError:
+        pass
+    classification = dict()
+    for stereotype in node.stereotypes:
+        entry = field_index.get(stereotype.name)
+        if entry is not None and entry[0] not in classification:
+            classification[entry[0]] = entry[1]
+    node.__dict__['_agx_dexterity_fields'] = classification
+    return classification
+
+
+def tagged_values(source, stereotype):
+    """Read all tagged values of stereotype applied to source into a dict.
+
+    Like ``TaggedValues.direct``, the first tagged value of a name wins.
+    """
+    values = dict()
+    stereotype = source.stereotype(stereotype)
+    if stereotype is None:
+        return values
+    for tgv in stereotype.taggedvalues:
+        if tgv.name not in values:
+            values[tgv.name] = tgv.value
+    return values
+
+
+# Lines of blocks of python classes and modules are indexed per node. The
+# index is updated by ``ensure_directives`` and ``remove_directives`` and
+# validated against the blocks it was built from on each access, without
+# reading their lines. It gets rebuilt if children of the node were added or
+# removed, or if other generators replaced or extended the lines of a block.
+
+
+def directive_index(node):
+    """Return index of lines contained in blocks of python class or module.
+
+    The index is a dict with ``lines``, mapping lines to the number of
+    their occurrences, and ``blocks``, a list of ``(block, lines, length)``
+    the index was built from.
+    """
+    index = node.__dict__.get('_agx_dexterity_directives')
+    if index is not None and index['count'] == len(node):
+        for block, lines, length in index['blocks']:
+            if node.get(block.__name__) is not block \
+              or block.lines is not lines or len(lines) != length:
+                break
+        else:
+            return index
+    index = {
+        'count': len(node),
+        'blocks': list(),
+        'lines': dict(),
+    }
+    for block in node.blocks():
+        lines = block.lines
+        index['blocks'].append((block, lines, len(lines)))
+        for line in lines:
+            index['lines'][line] = index['lines'].get(line, 0) + 1
+    node.__dict__['_agx_dexterity_directives'] = index
+    return index
+
+
+def directive_lines(node):
+    """Return lines contained in blocks of python class or module.
+
+    Supports membership tests and iteration.
+    """
+    return directive_index(node)['lines']
+
+
+def ensure_directives(node, directives, insert=None):
+    """Ensure directive lines exist in blocks of python class or module.
+
+    Missing directives are added in a new block, which is inserted as first
+    child of node or, if given, after node ``insert``. Return the new block
+    or None if all directives already exist.
+    """
+    index = directive_index(node)
+    counts = index['lines']
+    missing = [line for line in directives if line not in counts]
+    if not missing:
+        return None
+    block = python.Block()
+    block.__name__ = str(uuid.uuid4())
+    block.lines.extend(missing)
+    if insert is None:
+        node.insertfirst(block)
+    else:
+        node.insertafter(block, insert)
+    for line in missing:
+        counts[line] = counts.get(line, 0) + 1
+    index['blocks'].append((block, block.lines, len(block.lines)))
+    index['count'] = len(node)
+    return block
+
+
+def remove_directives(node, directives):
+    """Remove directive lines from blocks of python class or module.
+
+    Blocks left empty are removed.
+    """
+    directives = set(directives)
+    index = directive_index(node)
+    counts = index['lines']
+    if not [line for line in directives if line in counts]:
+        return
+    blocks = list()
+    for block, lines, length in index['blocks']:
+        kept = [line for line in lines if line not in directives]
+        if len(kept) == length:
+            blocks.append((block, lines, length))
+            continue
+        for line in lines:
+            if line in directives:
+                counts[line] -= 1
+                if not counts[line]:
+                    del counts[line]
+        if kept:
+            block.lines = kept
+            blocks.append((block, kept, len(kept)))
+        else:
+            node.detach(block.__name__)
+    index['blocks'] = blocks
+    index['count'] = len(node)
+
+
+def code_fragments(node):
+    """Return list of code fragments of python node and its children.
+
+    Contains lines of blocks, base classes, attribute values and arguments,
+    but neither imports nor docstrings.
+    """
+    fragments = list()
+    def walk(node):
+        for child in node.values():
+            if IBlock.providedBy(child) or IProtectedSection.providedBy(child):
+                fragments.extend(child.lines)
+            if IClass.providedBy(child):
+                fragments.extend(child.bases)
+            if IDecorator.providedBy(child):
+                fragments.append(child.decoratorname)
+            if IAttribute.providedBy(child):
+                fragments.append(child.value)
+            if ICallableArguments.providedBy(child):
+                fragments.extend(child.args)
+                fragments.extend(child.kwargs.values())
+            walk(child)
+    walk(node)
+    return [fragment for fragment in fragments
+            if isinstance(fragment, basestring)]
+
+
+def remove_imports(module, imports):
+    """Remove imported names from python module unless still used by its
+    code.
+
+    @param imports: list of ``(fromimport, name)`` tuples
+    """
+    existing = set()
+    for imp in module.imports():
+        for name, alias in imp.names:
+            if alias is None and (imp.fromimport, name) in imports:
+                existing.add((imp.fromimport, name))
+    if not existing:
+        return
+    code = '\n'.join(code_fragments(module))
+    unused = set([(fromimport, name) for fromimport, name in existing
+                  if not re.search(r'\b%s\b' % re.escape(name), code)])
+    if not unused:
+        return
+    for imp in module.imports():
+        names = [n for n in imp.names
+                 if n[1] is not None or (imp.fromimport, n[0]) not in unused]
+        if len(names) == len(imp.names):
+            continue
+        if names:
+            imp.names = names
+        else:
+            module.detach(imp.__name__)
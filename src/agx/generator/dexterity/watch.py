@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+from agx.generator.dexterity.batch import Batch
+
+
+log = logging.getLogger('agx.generator.dexterity')
+
+
+# seconds between checks of model files
+INTERVAL = 0.5
+
+# seconds the modification time of a changed file must be stable before it
+# gets read. Modelers might write files in several steps
+SETTLE = 0.2
+
+
+def mtime(path):
+    """Modification time of file at path, None if missing.
+
+    Some editors replace files on save, thus they might be missing for a
+    moment.
+    """
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class Watcher(object):
+    """Regenerate models as soon as their files are saved.
+
+    Models and profiles are watched, models are generated as a batch, thus
+    configuration and unchanged profiles stay loaded. Tokens are scoped to a
+    single run.
+    """
+
+    def __init__(self, jobs, interval=INTERVAL, settle=SETTLE, options=None):
+        """@param jobs: list of ``(modelpaths, outdir)`` tuples
+        @param options: ``options.Options`` of all runs
+        """
+        self.jobs = jobs
+        self.options = options
+        self.interval = interval
+        self.settle = settle
+        self.mtimes = dict()
+        self.runs = 0
+        self.batch = None
+
+    def changed(self):
+        """Return jobs whose files changed since last call.
+
+        All jobs are considered changed on first call.
+        """
+        ret = list()
+        for job in self.jobs:
+            modelpaths = job[0]
+            current = [mtime(path) for path in modelpaths]
+            if None in current:
+                continue
+            if self.mtimes.get(job[1]) != current:
+                self.mtimes[job[1]] = current
+                ret.append(job)
+        return ret
+
+    def wait(self, jobs):
+        """Wait until files of jobs are not modified any more.
+        """
+        while True:
+            time.sleep(self.settle)
+            stable = True
+            for modelpaths, outdir in jobs:
+                current = [mtime(path) for path in modelpaths]
+                if self.mtimes.get(outdir) != current:
+                    self.mtimes[outdir] = current
+                    stable = False
+            if stable:
+                return
+
+    def generate(self, jobs):
+        for modelpaths, outdir in jobs:
+            start = time.time()
+            self.runs += 1
+            try:
+                self.batch.generate(modelpaths, outdir, self.options)
+            except Exception:
+                # keep watching, the model might be saved fixed
+                log.exception("Generating '%s' failed" % modelpaths[0])
+            else:
+                log.info("Generated '%s' into '%s' in %.2fs" % (
+                    modelpaths[0], outdir, time.time() - start))
+
+    def __call__(self, runs=None):
+        """Watch until interrupted or ``runs`` generator runs are done.
+        """
+        self.batch = Batch().open()
+        try:
+            while runs is None or self.runs < runs:
+                jobs = self.changed()
+                if not jobs:
+                    time.sleep(self.interval)
+                    continue
+                if self.runs:
+                    self.wait(jobs)
+                self.generate(jobs)
+        finally:
+            self.batch.close()
+            self.batch = None